@@ -3,6 +3,17 @@ from ultralytics import YOLO
 import argparse
 import torch
 import numpy as np
+import time
+import os
+import sys
+
+# Shared helpers (roi.py, ...) live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from roi import RoiMasker, load_roi_polygons, ROI_CONFIG_PATH
+from renderer import Renderer
+from video_io import open_video_reader, open_video_writer
+from cascade import CascadeDetector
+from soak import LoopingVideo, SoakMonitor, null_stage, SAMPLE_INTERVAL, TOP_ALLOCATIONS
 
 # Path to your trained model
 MODEL_PATH = r"runs/detect/train5/weights/best.pt"
@@ -10,6 +21,107 @@ MODEL_PATH = r"runs/detect/train5/weights/best.pt"
 # Class names (update if your classes.txt is different)
 CLASS_NAMES = ["fireextinguisher", "toolbox", "oxygen tank"]
 
+
+def confidence_style(cls, conf):
+    """Color coding and box thickness based on confidence"""
+    if conf >= 0.7:
+        return (0, 255, 0), 3  # Green for high confidence
+    elif conf >= 0.6:
+        return (0, 255, 255), 2  # Yellow for medium confidence
+    return (0, 165, 255), 2  # Orange for lower confidence
+
+# Adaptive quality ladder, ordered from most to least expensive: (inference imgsz, detect every Nth frame)
+ADAPTIVE_LEVELS = [(640, 1), (512, 1), (416, 1), (320, 1), (320, 2), (256, 2), (256, 3)]
+
+
+class AdaptiveController:
+    """
+    Holds a per-frame latency budget by moving along ADAPTIVE_LEVELS.
+
+    Inference latency is smoothed with an EMA. The effective per-frame cost of a level is
+    latency / stride; we step down when it exceeds the budget by more than the hysteresis
+    margin, and step up only when the next better level is predicted (latency scales with
+    imgsz^2) to fit under the budget minus the margin. After every change the controller
+    waits `cooldown` inferences before deciding again so it does not oscillate.
+
+    With a target FPS the budget is the whole frame time, so the EMA of the rest of the loop
+    (read, draw, display, write; see record_overhead) is subtracted before it is compared with
+    inference cost. A --latency-budget applies to inference alone.
+    """
+
+    def __init__(self, target_fps=None, latency_budget_ms=None, max_imgsz=640,
+                 hysteresis=0.15, cooldown=15, alpha=0.2):
+        # Only an FPS target covers the whole frame; an explicit latency budget is inference-only
+        self.frame_budget = latency_budget_ms is None
+        if latency_budget_ms is None:
+            latency_budget_ms = 1000.0 / (target_fps or 15.0)
+        self.budget = latency_budget_ms / 1000.0
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.levels = [lvl for lvl in ADAPTIVE_LEVELS if lvl[0] <= max_imgsz] or [ADAPTIVE_LEVELS[-1]]
+        self.index = 0
+        self.ema_latency = None
+        self.ema_overhead = 0.0
+        self.samples = 0
+
+    @property
+    def imgsz(self):
+        return self.levels[self.index][0]
+
+    @property
+    def stride(self):
+        return self.levels[self.index][1]
+
+    def should_infer(self, frame_idx):
+        return frame_idx % self.stride == 0
+
+    @property
+    def infer_budget(self):
+        """Share of the budget left for inference (never below 10% of it, so the ladder still has a target)"""
+        if not self.frame_budget:
+            return self.budget
+        return max(self.budget - self.ema_overhead, 0.1 * self.budget)
+
+    def record_overhead(self, seconds):
+        """Record the non-inference time of one frame (only used with a target FPS)"""
+        self.ema_overhead = self.alpha * seconds + (1 - self.alpha) * self.ema_overhead
+
+    def _predicted_cost(self, index):
+        imgsz, stride = self.levels[index]
+        scale = (imgsz / self.imgsz) ** 2
+        return self.ema_latency * scale / stride
+
+    def update(self, latency):
+        """Record one inference latency (seconds). Returns a log message if the level changed."""
+        if self.ema_latency is None:
+            self.ema_latency = latency
+        else:
+            self.ema_latency = self.alpha * latency + (1 - self.alpha) * self.ema_latency
+        self.samples += 1
+        if self.samples < self.cooldown:
+            return None
+
+        old = self.levels[self.index]
+        cost = self._predicted_cost(self.index)
+        budget = self.infer_budget
+        if cost > budget * (1 + self.hysteresis) and self.index < len(self.levels) - 1:
+            self.index += 1
+        elif self.index > 0 and self._predicted_cost(self.index - 1) < budget * (1 - self.hysteresis):
+            self.index -= 1
+        else:
+            return None
+
+        # Rescale the EMA to the new resolution so the next decisions start from a sensible estimate
+        self.ema_latency *= (self.imgsz / old[0]) ** 2
+        self.samples = 0
+        return (f"[adaptive] imgsz {old[0]} -> {self.imgsz}, detect every {old[1]} -> {self.stride} frame(s) "
+                f"(latency {latency * 1000:.1f} ms, cost {cost * 1000:.1f} ms/frame, inference budget {budget * 1000:.1f} ms)")
+
+    def status(self):
+        lat = (self.ema_latency or 0.0) * 1000
+        return f"Adaptive: {self.imgsz}px | every {self.stride} | {lat:.0f}/{self.infer_budget * 1000:.0f} ms"
+
 def main():
     parser = argparse.ArgumentParser(description="Real-Time Object Detection with YOLO")
     parser.add_argument('--source', type=str, default='0', help='Webcam index (0, 1, ...) or DroidCam IP URL (e.g., http://192.168.1.2:4747/video)')
@@ -18,6 +130,24 @@ def main():
     parser.add_argument('--conf', type=float, default=0.5, help='Confidence threshold (default: 0.5)')
     parser.add_argument('--iou', type=float, default=0.5, help='IoU threshold for NMS (default: 0.5)')
     parser.add_argument('--max-det', type=int, default=300, help='Maximum detections per image (default: 300)')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference size; upper bound when --adaptive is set (default: 640)')
+    parser.add_argument('--adaptive', action='store_true', help='Adapt inference size and detection cadence to hold the FPS/latency target')
+    parser.add_argument('--target-fps', type=float, default=15.0, help='FPS to hold in adaptive mode (default: 15)')
+    parser.add_argument('--latency-budget', type=float, default=None, help='Per-frame latency budget in ms for adaptive mode (overrides --target-fps)')
+    parser.add_argument('--cascade-small', type=str, default=None, help='Small first-stage model; enables cascade mode with the main model as second stage')
+    parser.add_argument('--cascade-band', type=float, nargs=2, default=[0.25, 0.6], help='Small-model confidence band that escalates to the large model (default: 0.25 0.6)')
+    parser.add_argument('--cascade-mode', type=str, default='crops', choices=['crops', 'frame'], help='Escalate ambiguous crops only, or the whole frame')
+    parser.add_argument('--video-io', type=str, default='opencv', choices=['opencv', 'ffmpeg'], help='Video I/O backend (ffmpeg pipes run decode/encode off the inference thread)')
+    parser.add_argument('--codec', type=str, default='libx264', help='ffmpeg encoder for --output with --video-io ffmpeg (default: libx264)')
+    parser.add_argument('--preset', type=str, default='ultrafast', help='ffmpeg encoder preset (default: ultrafast)')
+    parser.add_argument('--boxes-only', action='store_true', help='Draw boxes without labels (fastest rendering)')
+    parser.add_argument('--soak', type=str, default=None, help='Soak test: replay this video file in a loop instead of --source and profile the run')
+    parser.add_argument('--soak-fps', type=float, default=None, help='Replay rate for --soak (default: the video FPS)')
+    parser.add_argument('--soak-duration', type=float, default=0, help='Stop the soak test after this many seconds (default: until q)')
+    parser.add_argument('--soak-interval', type=float, default=SAMPLE_INTERVAL, help=f'Seconds between soak report rows (default: {SAMPLE_INTERVAL:.0f})')
+    parser.add_argument('--soak-report', type=str, default=None, help='Soak report path (default: soak/soak_<timestamp>.jsonl)')
+    parser.add_argument('--soak-top', type=int, default=TOP_ALLOCATIONS, help=f'Allocation sites per report row, 0 disables tracemalloc (default: {TOP_ALLOCATIONS})')
+    parser.add_argument('--roi-config', type=str, default=ROI_CONFIG_PATH, help='ROI polygon config; inference is restricted to the polygons of --source')
     args = parser.parse_args()
 
     # Check GPU availability and set device
@@ -44,10 +174,33 @@ def main():
     print(f"Confidence threshold: {args.conf}")
     print(f"IoU threshold: {args.iou}")
 
-    # Open video capture
-    cap = cv2.VideoCapture(source)
+    controller = None
+    if args.adaptive:
+        controller = AdaptiveController(target_fps=args.target_fps, latency_budget_ms=args.latency_budget,
+                                        max_imgsz=args.imgsz)
+        scope = 'whole frame' if controller.frame_budget else 'inference'
+        print(f"Adaptive mode: budget {controller.budget * 1000:.1f} ms/frame ({scope}), starting at imgsz {controller.imgsz}")
+
+    masker = None
+    polygons = load_roi_polygons(args.source, args.roi_config)
+    if polygons:
+        masker = RoiMasker(polygons)
+        print(f"ROI mode: {len(polygons)} region(s) for source {args.source}")
+
+    cascade = None
+    if args.cascade_small:
+        small_model = YOLO(args.cascade_small)
+        small_model.to(device)
+        # Both stages honour the ROIs and the same max_det/half settings as the single-model path
+        cascade = CascadeDetector(small_model, model, band=tuple(args.cascade_band), mode=args.cascade_mode,
+                                  conf=args.conf, iou=args.iou, device=device, masker=masker,
+                                  max_det=args.max_det, half=device != 'cpu')
+        print(f"Cascade mode: {args.cascade_small} first, escalating to the main model in band {args.cascade_band}")
+
+    # Open video capture (a soak test replays a file forever at a fixed rate)
+    cap = LoopingVideo(args.soak, args.soak_fps) if args.soak else open_video_reader(source, args.video_io)
     if not cap.isOpened():
-        print(f"Error: Could not open video source {args.source}")
+        print(f"Error: Could not open video source {args.soak or args.source}")
         return
 
     # Get video properties
@@ -55,103 +208,138 @@ def main():
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     print(f"Video source: {width}x{height} @ {fps:.1f} FPS")
+    if masker:
+        print(f"ROI mode: crops cost {masker.inference_fraction((height, width, 3), args.imgsz):.0%} of a full-frame inference")
 
     # Prepare video writer if output is specified
     writer = None
     if args.output:
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(args.output, fourcc, fps, (width, height))
+        writer = open_video_writer(args.output, fps, (width, height), args.video_io, args.codec, args.preset)
         print(f"Saving output to: {args.output}")
 
-    import time
+    renderer = Renderer(CLASS_NAMES, style_fn=confidence_style, font_scale=0.7, boxes_only=args.boxes_only)
+
     prev_time = time.time()
     frame_count = 0
+    frame_idx = 0
     fps_display = 0
+    detections = None
+
+    monitor = None
+    if args.soak:
+        monitor = SoakMonitor(args.soak_report, interval=args.soak_interval, duration=args.soak_duration, top=args.soak_top)
+    stage = monitor.stage if monitor else null_stage
     
     print("Starting real-time detection... Press 'q' to quit")
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Failed to grab frame")
-            break
-
-        # Run YOLO inference with optimized parameters
-        with torch.no_grad():
-            results = model(
-                frame, 
-                device=device, 
-                conf=args.conf,
-                iou=args.iou,
-                max_det=args.max_det,
-                verbose=False,
-                augment=False,  # Disable test-time augmentation for speed
-                agnostic_nms=False,  # Class-specific NMS
-                half=True if device != 'cpu' else False  # Use FP16 for GPU
-            )[0]
-
-        # Draw detections
-        if results.boxes is not None:
-            for box in results.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                conf = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                
-                # Apply basic filters
-                if (conf >= args.conf and 
-                    cls < len(CLASS_NAMES) and
-                    x1 >= 0 and y1 >= 0 and x2 <= width and y2 <= height):  # Boundary check
-                    
-                    label = f"{CLASS_NAMES[cls]} {conf:.2f}"
-                    
-                    # Color coding based on confidence
-                    if conf >= 0.7:
-                        color = (0, 255, 0)  # Green for high confidence
-                    elif conf >= 0.6:
-                        color = (0, 255, 255)  # Yellow for medium confidence
+    try:
+        while True:
+            if monitor:
+                cap.wait()
+            frame_start = time.perf_counter()
+            with stage('read'):
+                ret, frame = cap.read()
+            if not ret:
+                print("Failed to grab frame")
+                break
+
+            # Run YOLO inference with optimized parameters (adaptive mode may reuse the previous result)
+            infer_time = 0.0
+            if controller is None or detections is None or controller.should_infer(frame_idx):
+                imgsz = controller.imgsz if controller else args.imgsz
+                infer_kwargs = dict(
+                    device=device, 
+                    conf=args.conf,
+                    iou=args.iou,
+                    max_det=args.max_det,
+                    verbose=False,
+                    augment=False,  # Disable test-time augmentation for speed
+                    agnostic_nms=False,  # Class-specific NMS
+                    half=True if device != 'cpu' else False  # Use FP16 for GPU
+                )
+                infer_start = time.perf_counter()
+                with torch.no_grad():
+                    if cascade:
+                        # Small model every frame; the large model only sees ambiguous frames/crops
+                        cascade.imgsz = imgsz
+                        detections = cascade.detect(frame)[:3]
+                    elif masker:
+                        # Only the ROI crops are inferred; boxes come back in frame coordinates
+                        detections = masker.detect(model, frame, imgsz=imgsz, **infer_kwargs)
                     else:
-                        color = (0, 165, 255)  # Orange for lower confidence
-                    
-                    # Draw bounding box with thickness based on confidence
-                    thickness = 3 if conf >= 0.7 else 2
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
-                    
-                    # Draw label background
-                    label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0]
-                    cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), color, -1)
-                    
-                    # Draw label text
-                    cv2.putText(frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2)
-
-        # FPS calculation and display
-        frame_count += 1
-        if frame_count >= 10:
-            curr_time = time.time()
-            fps_display = frame_count / (curr_time - prev_time)
-            prev_time = curr_time
-            frame_count = 0
-
-        # Display information
-        cv2.putText(frame, f"FPS: {fps_display:.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.putText(frame, f"Device: {device.upper()}", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-        cv2.putText(frame, f"Conf: {args.conf} | IoU: {args.iou}", (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
-
-        # Show frame
-        cv2.imshow('Real-Time Detection (Press Q to quit)', frame)
-
-        # Write frame if saving
-        if writer:
-            writer.write(frame)
-
-        # Check for quit
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+                        r = model(frame, imgsz=imgsz, **infer_kwargs)[0]
+                        detections = (r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(),
+                                      r.boxes.cls.cpu().numpy().astype(int))
+                infer_time = time.perf_counter() - infer_start
+                if monitor:
+                    monitor.record('infer', infer_time * 1000)
+                if controller:
+                    change = controller.update(infer_time)
+                    if change:
+                        print(change)
+            frame_idx += 1
+
+            # Draw detections
+            with stage('draw'):
+                if masker:
+                    masker.draw(frame)
+                boxes, confs, clss = detections
+                # Apply basic filters (confidence, known class, boundary check)
+                keep = ((confs >= args.conf) & (clss < len(CLASS_NAMES)) &
+                        (boxes[:, 0] >= 0) & (boxes[:, 1] >= 0) & (boxes[:, 2] <= width) & (boxes[:, 3] <= height))
+                renderer.draw(frame, boxes[keep], confs[keep], clss[keep])
+
+            # FPS calculation and display
+            frame_count += 1
+            if frame_count >= 10:
+                curr_time = time.time()
+                fps_display = frame_count / (curr_time - prev_time)
+                prev_time = curr_time
+                frame_count = 0
+
+            # Display information
+            cv2.putText(frame, f"FPS: {fps_display:.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+            cv2.putText(frame, f"Device: {device.upper()}", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+            cv2.putText(frame, f"Conf: {args.conf} | IoU: {args.iou}", (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+            if controller:
+                cv2.putText(frame, controller.status(), (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+            if cascade:
+                cv2.putText(frame, f"Escalated: {cascade.escalation_rate:.0%}", (10, 190), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+
+            # Show frame
+            with stage('display'):
+                cv2.imshow('Real-Time Detection (Press Q to quit)', frame)
+
+            # Write frame if saving
+            if writer:
+                with stage('write'):
+                    writer.write(frame)
+
+            # Check for quit ('p'/'y' toggle the profilers in a soak test)
+            key = cv2.waitKey(1) & 0xFF
+            if controller:
+                controller.record_overhead(time.perf_counter() - frame_start - infer_time)
+            if monitor:
+                monitor.record('frame', (time.perf_counter() - frame_start) * 1000)
+                monitor.handle_key(key)
+                if not monitor.tick():
+                    print("Soak duration reached")
+                    break
+            if key == ord('q'):
+                break
+    except KeyboardInterrupt:
+        print("Interrupted by user")
 
     # Cleanup
+    if monitor:
+        monitor.close()
+        print(f"Replayed {args.soak} {cap.loops} times, {cap.late} frames late")
     cap.release()
     if writer:
         writer.release()
     cv2.destroyAllWindows()
+    if cascade:
+        print(f"Cascade escalation rate: {cascade.escalation_rate:.1%} of {cascade.frames} frames")
     print("Detection stopped")
 
 if __name__ == "__main__":
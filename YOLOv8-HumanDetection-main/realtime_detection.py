@@ -7,9 +7,17 @@ import torch
 import threading
 from collections import deque
 import os
+import sys
+
+# Shared helpers (roi.py, ...) live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from roi import RoiMasker, load_roi_polygons, ROI_CONFIG_PATH
+from renderer import Renderer
+from video_io import open_video_writer
+from soak import LoopingVideo, SoakMonitor, null_stage, SAMPLE_INTERVAL, TOP_ALLOCATIONS
 
 class HumanDetector:
-    def __init__(self, model_path='best.pt', device=None, conf_threshold=0.5, iou_threshold=0.45):
+    def __init__(self, model_path='best.pt', device=None, conf_threshold=0.5, iou_threshold=0.45, roi_polygons=None, boxes_only=False):
         """
         Initialize the human detector and ensemble object detector
         
@@ -18,6 +26,8 @@ class HumanDetector:
             device (str): Device to run inference on ('cuda', 'cuda:0', or 'cpu'). If None, auto-selects GPU if available.
             conf_threshold (float): Confidence threshold for detections
             iou_threshold (float): IoU threshold for NMS
+            roi_polygons (list): Optional ROI polygons; when set, inference only runs inside them
+            boxes_only (bool): Draw boxes without labels (fastest rendering)
         """
         self.model_path = model_path
         self.model2_path = os.path.join('model2', 'best.pt')
@@ -29,6 +39,7 @@ class HumanDetector:
             self.device = device
         self.conf_threshold = conf_threshold
         self.iou_threshold = iou_threshold
+        self.roi_masker = RoiMasker(roi_polygons) if roi_polygons else None
         
         # Check CUDA availability
         self.cuda_available = torch.cuda.is_available() if self.device.startswith('cuda') else False
@@ -42,6 +53,8 @@ class HumanDetector:
         # Performance tracking
         self.fps_queue = deque(maxlen=30)
         self.frame_times = deque(maxlen=30)
+        # Per-stage timing hook, pointed at a SoakMonitor during soak tests
+        self.stage = null_stage
         
         # Detection colors
         self.colors = {
@@ -53,6 +66,12 @@ class HumanDetector:
             'background': (0, 0, 0)  # Black for background
         }
         
+        # Shared renderer; class ids index the combined human + object class list
+        render_names = ['human'] + self.model2_class_names
+        self.renderer = Renderer(render_names, colors=self.colors, text_color=self.colors['text'],
+                                 label_fmt='{name}: {conf:.0%}', boxes_only=boxes_only)
+        self.render_ids = {name: i for i, name in enumerate(render_names)}
+        
     def load_models(self):
         """Load the YOLOv8 models (human and object)"""
         try:
@@ -74,6 +93,24 @@ class HumanDetector:
             print(f"❌ Error loading model(s): {e}")
             raise
     
+    def infer(self, model, frame):
+        """
+        Run one model on the frame, restricted to the ROIs if configured
+        Args:
+            model (YOLO): Model to run
+            frame (numpy.ndarray): Input frame
+        Returns:
+            tuple: (confidences, classes, bboxes) numpy arrays in frame coordinates
+        """
+        if self.roi_masker:
+            bboxes, confidences, classes = self.roi_masker.detect(
+                model, frame, conf=self.conf_threshold, iou=self.iou_threshold, verbose=False)
+            return confidences, classes, bboxes
+        boxes = model(frame, conf=self.conf_threshold, iou=self.iou_threshold, verbose=False)[0].boxes
+        if boxes is None:
+            return np.zeros(0), np.zeros(0), np.zeros((0, 4))
+        return boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy(), boxes.xyxy.cpu().numpy()
+
     def detect_all(self, frame):
         """
         Detect humans and objects in the frame using both models
@@ -84,51 +121,40 @@ class HumanDetector:
         """
         try:
             # Run human detection
-            results1 = self.model(frame, conf=self.conf_threshold, iou=self.iou_threshold, verbose=False)
-            result1 = results1[0]
-            boxes1 = result1.boxes
             detection_info = []
-            if boxes1 is not None:
-                num_detections = len(boxes1)
-                confidences = boxes1.conf.cpu().numpy()
-                classes = boxes1.cls.cpu().numpy()
-                bboxes = boxes1.xyxy.cpu().numpy()
-                for i in range(num_detections):
-                    conf = confidences[i]
-                    class_id = int(classes[i])
-                    bbox = bboxes[i]
-                    detection_info.append({
-                        'class': 'human',
-                        'confidence': conf,
-                        'bbox': bbox,
-                        'class_id': class_id
-                    })
+            with self.stage('human'):
+                confidences, classes, bboxes = self.infer(self.model, frame)
+            for i in range(len(bboxes)):
+                conf = confidences[i]
+                class_id = int(classes[i])
+                bbox = bboxes[i]
+                detection_info.append({
+                    'class': 'human',
+                    'confidence': conf,
+                    'bbox': bbox,
+                    'class_id': class_id
+                })
             # Run object detection (ensemble model)
-            results2 = self.model2(frame, conf=self.conf_threshold, iou=self.iou_threshold, verbose=False)
-            result2 = results2[0]
-            boxes2 = result2.boxes
-            if boxes2 is not None:
-                num_detections2 = len(boxes2)
-                confidences2 = boxes2.conf.cpu().numpy()
-                classes2 = boxes2.cls.cpu().numpy()
-                bboxes2 = boxes2.xyxy.cpu().numpy()
-                for i in range(num_detections2):
-                    conf = confidences2[i]
-                    class_id = int(classes2[i])
-                    bbox = bboxes2[i]
-                    # Map class_id to class name
-                    if 0 <= class_id < len(self.model2_class_names):
-                        class_name = self.model2_class_names[class_id]
-                    else:
-                        class_name = f'class_{class_id}'
-                    detection_info.append({
-                        'class': class_name,
-                        'confidence': conf,
-                        'bbox': bbox,
-                        'class_id': class_id
-                    })
+            with self.stage('objects'):
+                confidences2, classes2, bboxes2 = self.infer(self.model2, frame)
+            for i in range(len(bboxes2)):
+                conf = confidences2[i]
+                class_id = int(classes2[i])
+                bbox = bboxes2[i]
+                # Map class_id to class name
+                if 0 <= class_id < len(self.model2_class_names):
+                    class_name = self.model2_class_names[class_id]
+                else:
+                    class_name = f'class_{class_id}'
+                detection_info.append({
+                    'class': class_name,
+                    'confidence': conf,
+                    'bbox': bbox,
+                    'class_id': class_id
+                })
             # Draw detections on frame
-            annotated_frame = self.draw_detections(frame, detection_info)
+            with self.stage('draw'):
+                annotated_frame = self.draw_detections(frame, detection_info)
             return annotated_frame, detection_info
         except Exception as e:
             print(f"❌ Error in detection: {e}")
@@ -145,37 +171,21 @@ class HumanDetector:
         Returns:
             numpy.ndarray: Annotated frame
         """
-        annotated_frame = frame.copy()
+        if not detections:
+            return frame
         
+        class_ids = []
         for detection in detections:
-            bbox = detection['bbox']
-            confidence = detection['confidence']
             class_name = detection.get('class', 'object')
-            
-            # Extract coordinates
-            x1, y1, x2, y2 = map(int, bbox)
-            
-            # Draw bounding box
-            color = self.colors.get(class_name, (255, 255, 255))
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
-            
-            # Draw label background
-            label = f"{class_name}: {confidence:.2%}"
-            (label_width, label_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-            
-            # Draw label background rectangle
-            cv2.rectangle(annotated_frame, 
-                         (x1, y1 - label_height - 10), 
-                         (x1 + label_width, y1), 
-                         color, -1)
-            
-            # Draw label text
-            cv2.putText(annotated_frame, label, 
-                       (x1, y1 - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, 
-                       self.colors['text'], 2)
+            if class_name not in self.render_ids:
+                self.render_ids[class_name] = len(self.renderer.class_names)
+                self.renderer.class_names.append(class_name)
+            class_ids.append(self.render_ids[class_name])
         
-        return annotated_frame
+        # Draw in place: labels are cached sprites, so no per-frame text measuring or copying
+        bboxes = np.array([detection['bbox'] for detection in detections])
+        confidences = np.array([detection['confidence'] for detection in detections])
+        return self.renderer.draw(frame, bboxes, confidences, class_ids)
     
     def draw_stats(self, frame, fps, num_detections, device_info):
         """
@@ -190,8 +200,8 @@ class HumanDetector:
         Returns:
             numpy.ndarray: Frame with stats
         """
-        # Create stats overlay
-        stats_frame = frame.copy()
+        # Stats overlay is drawn in place
+        stats_frame = frame
         
         # Draw background for stats
         cv2.rectangle(stats_frame, (10, 10), (300, 120), (0, 0, 0), -1)
@@ -220,19 +230,26 @@ class HumanDetector:
         
         return 1.0 / avg_time if avg_time > 0 else 0.0
     
-    def run_realtime_detection(self, camera_id=0, output_path=None):
+    def run_realtime_detection(self, camera_id=0, output_path=None, video_io='opencv', codec='libx264', preset='ultrafast',
+                               soak_video=None, soak_fps=None, monitor=None):
         """
         Run real-time human detection on camera feed
         
         Args:
             camera_id (int): Camera device ID
             output_path (str): Optional path to save video output
+            video_io (str): Writer backend, 'opencv' (mp4v) or 'ffmpeg' (encodes in a separate process)
+            codec (str): ffmpeg encoder used with video_io='ffmpeg'
+            preset (str): ffmpeg encoder preset used with video_io='ffmpeg'
+            soak_video (str): Replay this video file in a loop instead of the camera (soak test)
+            soak_fps (float): Replay rate for soak_video (default: the video FPS)
+            monitor (SoakMonitor): Records per-stage latency, memory and GC over time; 'p'/'y' toggle profilers
         """
-        # Initialize camera
-        cap = cv2.VideoCapture(camera_id)
+        # Initialize camera (a soak test replays a file forever at a fixed rate)
+        cap = LoopingVideo(soak_video, soak_fps) if soak_video else cv2.VideoCapture(camera_id)
         
         if not cap.isOpened():
-            print(f"❌ Error: Could not open camera {camera_id}")
+            print(f"❌ Error: Could not open {'video ' + soak_video if soak_video else f'camera {camera_id}'}")
             return
         
         # Get camera properties
@@ -248,18 +265,23 @@ class HumanDetector:
         # Initialize video writer if output path is provided
         video_writer = None
         if output_path:
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            video_writer = cv2.VideoWriter(output_path, fourcc, 30.0, (frame_width, frame_height))
+            video_writer = open_video_writer(output_path, 30.0, (frame_width, frame_height), video_io, codec, preset)
             print(f"📹 Recording to: {output_path}")
         
         # Performance tracking
         frame_count = 0
         start_time = time.time()
+        if monitor:
+            self.stage = monitor.stage
         
         try:
             while True:
                 # Read frame
-                ret, frame = cap.read()
+                if soak_video:
+                    cap.wait()
+                frame_start = time.perf_counter()
+                with self.stage('read'):
+                    ret, frame = cap.read()
                 if not ret:
                     print("❌ Error reading frame from camera")
                     break
@@ -270,6 +292,8 @@ class HumanDetector:
                 
                 # Detect humans and objects
                 annotated_frame, detections = self.detect_all(frame)
+                if self.roi_masker:
+                    self.roi_masker.draw(annotated_frame)
                 
                 # Calculate FPS
                 current_fps = self.calculate_fps()
@@ -280,7 +304,8 @@ class HumanDetector:
                 final_frame = self.draw_stats(annotated_frame, current_fps, len(detections), device_info)
                 
                 # Display frame
-                cv2.imshow('YOLOv8 Human Detection - Real-time', final_frame)
+                with self.stage('display'):
+                    cv2.imshow('YOLOv8 Human Detection - Real-time', final_frame)
                 
                 # Handle key presses
                 key = cv2.waitKey(1) & 0xFF
@@ -300,9 +325,16 @@ class HumanDetector:
                 
                 # Write frame to video if recording
                 if video_writer:
-                    video_writer.write(final_frame)
+                    with self.stage('write'):
+                        video_writer.write(final_frame)
                 
                 frame_count += 1
+                if monitor:
+                    monitor.record('frame', (time.perf_counter() - frame_start) * 1000)
+                    monitor.handle_key(key)
+                    if not monitor.tick():
+                        print("⏱️  Soak duration reached")
+                        break
                 
         except KeyboardInterrupt:
             print("\n👋 Interrupted by user")
@@ -313,6 +345,11 @@ class HumanDetector:
             if video_writer:
                 video_writer.release()
             cv2.destroyAllWindows()
+            if monitor:
+                self.stage = null_stage
+                monitor.close()
+                if soak_video:
+                    print(f"🔁 Replayed {soak_video} {cap.loops} times, {cap.late} frames late")
             
             # Print final statistics
             total_time = time.time() - start_time
@@ -337,6 +374,28 @@ def main():
                        help='Camera device ID (default: 0)')
     parser.add_argument('--output', type=str, default=None,
                        help='Output video path (optional)')
+    parser.add_argument('--video-io', type=str, default='opencv', choices=['opencv', 'ffmpeg'],
+                       help='Video writer backend (default: opencv)')
+    parser.add_argument('--codec', type=str, default='libx264',
+                       help='ffmpeg encoder for --video-io ffmpeg (default: libx264)')
+    parser.add_argument('--preset', type=str, default='ultrafast',
+                       help='ffmpeg encoder preset (default: ultrafast)')
+    parser.add_argument('--boxes-only', action='store_true',
+                       help='Draw boxes without labels (fastest rendering)')
+    parser.add_argument('--soak', type=str, default=None,
+                       help='Soak test: replay this video file in a loop instead of the camera and profile the run')
+    parser.add_argument('--soak-fps', type=float, default=None,
+                       help='Replay rate for --soak (default: the video FPS)')
+    parser.add_argument('--soak-duration', type=float, default=0,
+                       help='Stop the soak test after this many seconds (default: until q)')
+    parser.add_argument('--soak-interval', type=float, default=SAMPLE_INTERVAL,
+                       help=f'Seconds between soak report rows (default: {SAMPLE_INTERVAL:.0f})')
+    parser.add_argument('--soak-report', type=str, default=None,
+                       help='Soak report path (default: soak/soak_<timestamp>.jsonl)')
+    parser.add_argument('--soak-top', type=int, default=TOP_ALLOCATIONS,
+                       help=f'Allocation sites per report row, 0 disables tracemalloc (default: {TOP_ALLOCATIONS})')
+    parser.add_argument('--roi-config', type=str, default=ROI_CONFIG_PATH,
+                       help='ROI polygon config; inference is restricted to the polygons of --camera')
     
     args = parser.parse_args()
     
@@ -351,13 +410,26 @@ def main():
         detector = HumanDetector(
             model_path=args.model,
             conf_threshold=args.conf,
-            iou_threshold=args.iou
+            iou_threshold=args.iou,
+            roi_polygons=load_roi_polygons(args.camera, args.roi_config),
+            boxes_only=args.boxes_only
         )
         
+        monitor = None
+        if args.soak:
+            monitor = SoakMonitor(args.soak_report, interval=args.soak_interval,
+                                  duration=args.soak_duration, top=args.soak_top)
+        
         # Run real-time detection
         detector.run_realtime_detection(
             camera_id=args.camera,
-            output_path=args.output
+            output_path=args.output,
+            video_io=args.video_io,
+            codec=args.codec,
+            preset=args.preset,
+            soak_video=args.soak,
+            soak_fps=args.soak_fps,
+            monitor=monitor
         )
         
     except Exception as e:
@@ -4,9 +4,21 @@ import numpy as np
 from ultralytics import YOLO
 import tempfile
 import os
+import sys
+import hashlib
 from PIL import Image
 import io
 
+# Shared helpers (renderer.py, ...) live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from renderer import Renderer
+
+MODEL_PATH = 'best.pt'
+# Inference runs once at this confidence; the sidebar slider only filters the cached detections
+RAW_CONF = 0.05
+# Oldest cached images are dropped beyond this many entries
+CACHE_SIZE = 256
+
 # Page configuration
 st.set_page_config(
     page_title="YOLOv8 Human Detection",
@@ -16,62 +28,97 @@ st.set_page_config(
 
 # Title and description
 st.title("👤 YOLOv8 Human Detection")
-st.markdown("Upload an image to detect humans using YOLOv8 model")
+st.markdown("Upload one or more images to detect humans using YOLOv8 model")
 
 # Load the model
 @st.cache_resource
 def load_model():
     """Load the YOLOv8 model"""
     try:
-        model = YOLO('best.pt')
+        model = YOLO(MODEL_PATH)
         return model
     except Exception as e:
         st.error(f"Error loading model: {e}")
         return None
 
+@st.cache_resource
+def load_renderer(class_names):
+    """Shared renderer, so its label sprite cache survives reruns (slider moves)"""
+    return Renderer(list(class_names), colors=[(128, 0, 128)] * len(class_names),
+                    text_color=(255, 255, 255), label_fmt='{name} {conf:.2f}')
+
+@st.cache_resource
+def detection_cache():
+    """Raw detections per (file content hash, model key), shared across reruns and sessions"""
+    return {}
+
+@st.cache_data(max_entries=CACHE_SIZE)
+def decode_image(digest, _data):
+    """RGB array of an uploaded file, decoded once per file content (keyed by its hash only)"""
+    return np.array(Image.open(io.BytesIO(_data)).convert('RGB'))
+
+@st.cache_data(max_entries=CACHE_SIZE)
+def encode_png(digest, conf_threshold, _annotated_image):
+    """PNG bytes for the download button, encoded once per (file content, threshold)"""
+    img_buffer = io.BytesIO()
+    _annotated_image.save(img_buffer, format='PNG', compress_level=1)
+    return img_buffer.getvalue()
+
+def model_key():
+    """Identify the loaded weights so cached detections are dropped when best.pt changes"""
+    return f"{os.path.abspath(MODEL_PATH)}:{os.path.getmtime(MODEL_PATH) if os.path.exists(MODEL_PATH) else 0}"
+
+# Function to run detection
+def detect_images(images, digests, model):
+    """
+    Return raw detections for each image, running the model only on images not seen before
+
+    Uncached images are inferred together as one batch at RAW_CONF. Widget interactions rerun
+    the script, but they hit the cache and never touch the model again.
+
+    Args:
+        images (list): Decoded RGB images
+        digests (list): SHA-1 of each uploaded file's bytes, the cache key
+
+    Returns:
+        list: (boxes, confidences, classes) numpy arrays per image
+    """
+    cache = detection_cache()
+    key = model_key()
+    keys = [(digest, key) for digest in digests]
+    missing = [i for i, k in enumerate(keys) if k not in cache]
+    if missing:
+        # Model expects BGR like cv2-loaded images
+        batch = [cv2.cvtColor(images[i], cv2.COLOR_RGB2BGR) for i in missing]
+        results = model(batch, conf=RAW_CONF, verbose=False)
+        for i, result in zip(missing, results):
+            boxes = result.boxes
+            cache[keys[i]] = (boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy().astype(int))
+    detections = [cache[k] for k in keys]
+    while len(cache) > CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+    return detections
+
 # Function to process image
-def process_image(image, model):
-    """Process image and return detection results"""
-    try:
-        # Convert PIL image to numpy array
-        if isinstance(image, Image.Image):
-            image_np = np.array(image)
-        else:
-            image_np = image
-            
-        # Run inference
-        results = model(image_np)
-        
-        # Get the first result
-        result = results[0]
-        
-        # Draw detections on image
-        annotated_image = result.plot()
-        
-        # Get detection info
-        boxes = result.boxes
-        if boxes is not None:
-            num_detections = len(boxes)
-            confidences = boxes.conf.cpu().numpy()
-            classes = boxes.cls.cpu().numpy()
-            
-            detection_info = []
-            for i in range(num_detections):
-                conf = confidences[i]
-                class_id = int(classes[i])
-                detection_info.append({
-                    'class': 'Human',
-                    'confidence': f"{conf:.2%}",
-                    'bbox': boxes.xyxy[i].cpu().numpy().tolist()
-                })
-        else:
-            detection_info = []
-            
-        return annotated_image, detection_info
+def process_image(image_np, raw_detections, conf_threshold, renderer):
+    """Filter cached detections by the slider threshold and draw them"""
+    boxes, confidences, classes = raw_detections
+    keep = confidences >= conf_threshold
+    boxes, confidences, classes = boxes[keep], confidences[keep], classes[keep]
+    
+    # Draw detections on a copy of the RGB image
+    annotated_image = renderer.draw(image_np.copy(), boxes, confidences, classes)
+    
+    # Get detection info
+    detection_info = []
+    for i in range(len(boxes)):
+        detection_info.append({
+            'class': 'Human',
+            'confidence': f"{confidences[i]:.2%}",
+            'bbox': boxes[i].tolist()
+        })
         
-    except Exception as e:
-        st.error(f"Error processing image: {e}")
-        return None, []
+    return annotated_image, detection_info
 
 # Load model
 with st.spinner("Loading YOLOv8 model..."):
@@ -81,11 +128,14 @@ if model is None:
     st.error("Failed to load model. Please check if 'best.pt' file exists in the current directory.")
     st.stop()
 
+renderer = load_renderer(tuple(model.names.values()))
+
 # File uploader
-uploaded_file = st.file_uploader(
-    "Choose an image file",
+uploaded_files = st.file_uploader(
+    "Choose image files",
     type=['png', 'jpg', 'jpeg', 'bmp', 'tiff'],
-    help="Upload an image to detect humans"
+    accept_multiple_files=True,
+    help="Upload one or more images to detect humans"
 )
 
 # Sidebar for settings
@@ -95,7 +145,7 @@ with st.sidebar:
     # Confidence threshold
     conf_threshold = st.slider(
         "Confidence Threshold",
-        min_value=0.0,
+        min_value=RAW_CONF,  # detections below RAW_CONF are never cached
         max_value=1.0,
         value=0.5,
         step=0.05,
@@ -109,65 +159,76 @@ with st.sidebar:
     st.info("Input Size: 640x640")
 
 # Main content
-if uploaded_file is not None:
-    # Create two columns
-    col1, col2 = st.columns([1, 1])
+if uploaded_files:
+    # Reruns (slider moves) only hash the raw file bytes; decoding and inference are cached by that hash
+    digests = [hashlib.sha1(f.getvalue()).hexdigest() for f in uploaded_files]
+    images = [decode_image(digest, f.getvalue()) for digest, f in zip(digests, uploaded_files)]
     
-    with col1:
-        st.subheader("📸 Original Image")
+    # Run the model once per new image (as one batch); slider changes reuse the cached detections
+    with st.spinner(f"Processing {len(images)} image(s)..."):
+        try:
+            raw_detections = detect_images(images, digests, model)
+        except Exception as e:
+            st.error(f"Error processing image: {e}")
+            raw_detections = [None] * len(images)
+    
+    for index, (uploaded_file, digest, image_np, raw) in enumerate(zip(uploaded_files, digests, images, raw_detections)):
+        # Create two columns
+        col1, col2 = st.columns([1, 1])
+      
+        with col1:
+            st.subheader("📸 Original Image")
         
-        # Display original image
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Original Image", use_column_width=True)
+            # Display original image
+            st.image(image_np, caption=uploaded_file.name, use_column_width=True)
         
-        # Image info
-        st.info(f"Image size: {image.size[0]} x {image.size[1]} pixels")
+            # Image info
+            st.info(f"Image size: {image_np.shape[1]} x {image_np.shape[0]} pixels")
     
-    with col2:
-        st.subheader("🎯 Detection Results")
+        with col2:
+            st.subheader("🎯 Detection Results")
         
-        # Process image
-        with st.spinner("Processing image..."):
-            annotated_image, detection_info = process_image(image, model)
+            # Filter and draw (no inference here)
+            if raw is not None:
+                annotated_image, detection_info = process_image(image_np, raw, conf_threshold, renderer)
+            else:
+                annotated_image, detection_info = None, []
         
-        if annotated_image is not None:
-            # Convert numpy array to PIL Image for display
-            if isinstance(annotated_image, np.ndarray):
-                annotated_image = Image.fromarray(annotated_image)
+            if annotated_image is not None:
+                # Convert numpy array to PIL Image for display
+                if isinstance(annotated_image, np.ndarray):
+                    annotated_image = Image.fromarray(annotated_image)
             
-            st.image(annotated_image, caption="Detected Humans", use_column_width=True)
+                st.image(annotated_image, caption="Detected Humans", use_column_width=True)
             
-            # Display detection information
-            if detection_info:
-                st.success(f"Found {len(detection_info)} human(s)")
-                
-                # Create a table for detection details
-                detection_data = []
-                for i, detection in enumerate(detection_info):
-                    detection_data.append({
-                        "Detection #": i + 1,
-                        "Class": detection['class'],
-                        "Confidence": detection['confidence'],
-                        "BBox": f"[{detection['bbox'][0]:.1f}, {detection['bbox'][1]:.1f}, {detection['bbox'][2]:.1f}, {detection['bbox'][3]:.1f}]"
-                    })
+                # Display detection information
+                if detection_info:
+                    st.success(f"Found {len(detection_info)} human(s)")
                 
-                st.dataframe(detection_data, use_container_width=True)
+                    # Create a table for detection details
+                    detection_data = []
+                    for i, detection in enumerate(detection_info):
+                        detection_data.append({
+                            "Detection #": i + 1,
+                            "Class": detection['class'],
+                            "Confidence": detection['confidence'],
+                            "BBox": f"[{detection['bbox'][0]:.1f}, {detection['bbox'][1]:.1f}, {detection['bbox'][2]:.1f}, {detection['bbox'][3]:.1f}]"
+                        })
                 
-                # Download button for annotated image
-                img_buffer = io.BytesIO()
-                annotated_image.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
+                    st.dataframe(detection_data, use_container_width=True)
                 
-                st.download_button(
-                    label="📥 Download Annotated Image",
-                    data=img_buffer.getvalue(),
-                    file_name="human_detection_result.png",
-                    mime="image/png"
-                )
+                    # Download button for annotated image
+                    st.download_button(
+                        label="📥 Download Annotated Image",
+                        data=encode_png(digest, conf_threshold, annotated_image),
+                        file_name=f"{os.path.splitext(uploaded_file.name)[0]}_detection.png",
+                        key=f"download_{index}_{uploaded_file.name}",
+                        mime="image/png"
+                    )
+                else:
+                    st.warning("No humans detected in the image")
             else:
-                st.warning("No humans detected in the image")
-        else:
-            st.error("Failed to process image")
+                st.error("Failed to process image")
 
 # Footer
 st.markdown("---")
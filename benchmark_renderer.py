@@ -0,0 +1,92 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from renderer import Renderer
+
+CLASS_NAMES = ["FireExtinguisher", "ToolBox", "OxygenTank"]
+COLORS = {0: (0, 0, 255), 1: (255, 165, 0), 2: (0, 255, 0)}
+
+
+# Reference copies of the drawing loops the renderer replaced (per-box tensor access left out,
+# so these numbers flatter the old code slightly)
+def legacy_draw_detections(frame, boxes, confs, clss):
+    """HumanDetector.draw_detections: copy the frame, measure and rasterize every label"""
+    annotated_frame = frame.copy()
+    for bbox, confidence, cls in zip(boxes, confs, clss):
+        class_name = CLASS_NAMES[cls]
+        x1, y1, x2, y2 = map(int, bbox)
+        color = COLORS.get(cls, (255, 255, 255))
+        cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
+        label = f"{class_name}: {confidence:.2%}"
+        (label_width, label_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+        cv2.rectangle(annotated_frame, (x1, y1 - label_height - 10), (x1 + label_width, y1), color, -1)
+        cv2.putText(annotated_frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    return annotated_frame
+
+
+def legacy_draw_boxes(frame, boxes, confs, clss):
+    """detect_in_video.draw_boxes: rectangle + putText per box"""
+    for (x1, y1, x2, y2), conf, cls in zip(boxes.astype(int), confs, clss):
+        label = f"{CLASS_NAMES[cls]}: {conf:.2f}"
+        color = (0, 255, 0)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return frame
+
+
+def random_detections(rng, n, width, height):
+    x1 = rng.uniform(0, width - 100, n)
+    y1 = rng.uniform(30, height - 100, n)
+    w = rng.uniform(20, 100, n)
+    h = rng.uniform(20, 100, n)
+    boxes = np.stack([x1, y1, x1 + w, y1 + h], axis=1).astype(np.float32)
+    confs = rng.uniform(0.5, 1.0, n).astype(np.float32)
+    clss = rng.integers(0, len(CLASS_NAMES), n)
+    return boxes, confs, clss
+
+
+def bench(name, fn, frame, detections, repeats):
+    # Each frame draws on a fresh copy of the source, like a camera loop does
+    work = frame.copy()
+    start = time.perf_counter()
+    for boxes, confs, clss in detections[:repeats]:
+        np.copyto(work, frame)
+        fn(work, boxes, confs, clss)
+    per_frame = (time.perf_counter() - start) / repeats * 1000
+    print(f"{name:<38} {per_frame:8.3f} ms/frame")
+    return per_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame cost of the shared renderer vs the old drawing loops")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--boxes', type=int, default=20, help='Detections per frame (default: 20)')
+    parser.add_argument('--frames', type=int, default=500, help='Frames to draw per implementation (default: 500)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    detections = [random_detections(rng, args.boxes, args.width, args.height) for _ in range(args.frames)]
+
+    renderer = Renderer(CLASS_NAMES, colors=COLORS, text_color=(255, 255, 255), label_fmt='{name}: {conf:.0%}')
+    fast = Renderer(CLASS_NAMES, colors=COLORS, boxes_only=True)
+    # Warm the sprite cache the way a long-running loop would
+    for boxes, confs, clss in detections[:50]:
+        renderer.draw(frame.copy(), boxes, confs, clss)
+
+    print(f"{args.width}x{args.height}, {args.boxes} boxes/frame, {args.frames} frames")
+    old = bench("legacy draw_detections (copy + labels)", legacy_draw_detections, frame, detections, args.frames)
+    bench("legacy draw_boxes (in place)", legacy_draw_boxes, frame, detections, args.frames)
+    new = bench("Renderer.draw (reusable buffer)", lambda f, b, c, k: renderer.draw(f, b, c, k, copy=True),
+                frame, detections, args.frames)
+    bench("Renderer.draw (in place)", renderer.draw, frame, detections, args.frames)
+    bench("Renderer.draw (boxes only)", fast.draw, frame, detections, args.frames)
+    print(f"Speed-up vs draw_detections: {old / new:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from ultralytics import YOLO
+
+from image_cache import CachedDetectionTrainer
+from train import TRAIN_ARGS, WORKERS, select_device
+
+
+def run(name, trainer, args, project):
+    """Train with `args` and return (setup seconds, per-epoch seconds)"""
+    model = YOLO(args["model"])
+    marks = {"epochs": []}
+
+    def pretrain_start(_):
+        marks["start"] = time.perf_counter()
+
+    def epoch_start(_):
+        marks.setdefault("first_epoch", time.perf_counter())
+        marks["epoch"] = time.perf_counter()
+
+    def epoch_end(_):
+        marks["epochs"].append(time.perf_counter() - marks["epoch"])
+
+    model.add_callback("on_pretrain_routine_start", pretrain_start)
+    model.add_callback("on_train_epoch_start", epoch_start)
+    model.add_callback("on_train_epoch_end", epoch_end)
+    model.train(trainer=trainer, project=project, name=name.replace(" ", "_"), **args)
+    return marks["first_epoch"] - marks["start"], marks["epochs"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Epoch time of the original vs CPU-capable training configuration")
+    parser.add_argument("--model", type=str, default="yolov8n.pt", help="Model to train (default: yolov8n.pt)")
+    parser.add_argument("--epochs", type=int, default=3, help="Epochs per configuration (default: 3)")
+    parser.add_argument("--fraction", type=float, default=0.25, help="Fraction of the train split to use (default: 0.25)")
+    parser.add_argument("--imgsz", type=int, default=TRAIN_ARGS["imgsz"])
+    parser.add_argument("--device", type=str, default=None, help="Device (default: auto, as in train.py)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"Loader workers for the new profile (default: {WORKERS})")
+    args = parser.parse_args()
+
+    common = {**TRAIN_ARGS, "model": args.model, "epochs": args.epochs, "imgsz": args.imgsz,
+              "fraction": args.fraction, "device": args.device or select_device(),
+              "val": False, "plots": False, "cache": False, "exist_ok": True}
+    configs = [
+        ("original (workers=0)", None, {"workers": 0}),
+        (f"workers={args.workers}", None, {"workers": args.workers}),
+        (f"workers={args.workers} + mmap cache", CachedDetectionTrainer, {"workers": args.workers}),
+    ]
+
+    results = []
+    with tempfile.TemporaryDirectory() as project:
+        for name, trainer, overrides in configs:
+            setup, epochs = run(name, trainer, {**common, **overrides}, project)
+            results.append((name, setup, epochs))
+
+    # The first epoch includes warm-up (and page-cache filling), so later epochs are shown separately
+    print(f"\n{args.model}, {args.epochs} epochs, {args.fraction:.0%} of train split, device {common['device']}, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'Configuration':<32}{'setup s':>9}{'epoch 1 s':>11}{'later epochs s':>16}{'speedup':>9}")
+    base = None
+    for name, setup, epochs in results:
+        later = float(np.mean(epochs[1:])) if len(epochs) > 1 else epochs[0]
+        base = base or later
+        print(f"{name:<32}{setup:>9.1f}{epochs[0]:>11.1f}{later:>16.1f}{base / later:>8.2f}x")
+    print("Setup of the mmap cache run includes building the store on the first run only; rerun to see it reused.")
+
+
+if __name__ == "__main__":
+    main()
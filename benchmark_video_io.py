@@ -0,0 +1,88 @@
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from video_io import FFmpegReader, FFmpegWriter, find_ffmpeg
+
+
+def synthetic_frames(n, width, height):
+    """Moving gradient + noise, so encoders have realistic work to do"""
+    rng = np.random.default_rng(0)
+    base = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    noise = rng.integers(0, 16, (height, width, 3), dtype=np.uint8)
+    return [np.dstack([np.roll(base, 8 * i, axis=1)] * 3) + noise for i in range(n)]
+
+
+def bench_writer(name, writer, frames, path):
+    # Time spent inside write() is what the inference loop pays; total includes flushing
+    start = time.perf_counter()
+    for frame in frames:
+        writer.write(frame)
+    blocking = time.perf_counter() - start
+    writer.release()
+    total = time.perf_counter() - start
+    size = os.path.getsize(path) / 1024 ** 2
+    print(f"{name:<32} loop {len(frames) / blocking:8.1f} fps | end-to-end {len(frames) / total:7.1f} fps | {size:7.2f} MB")
+
+
+def bench_reader(name, reader):
+    start = time.perf_counter()
+    count = 0
+    while True:
+        ret, _ = reader.read()
+        if not ret:
+            break
+        count += 1
+    elapsed = time.perf_counter() - start
+    reader.release()
+    print(f"{name:<32} decode {count / elapsed:8.1f} fps ({count} frames)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the OpenCV vs ffmpeg video I/O paths")
+    parser.add_argument('--video', type=str, default=None, help='Input video (default: synthetic frames)')
+    parser.add_argument('--frames', type=int, default=300, help='Frames to encode (default: 300)')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--codec', type=str, nargs='+', default=['libx264'], help='ffmpeg codecs to compare')
+    parser.add_argument('--preset', type=str, nargs='+', default=['ultrafast', 'veryfast'], help='x264 presets')
+    args = parser.parse_args()
+
+    if find_ffmpeg() is None:
+        print("ffmpeg not found (install it, set FFMPEG_BINARY or pip install imageio-ffmpeg)")
+        return
+
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        frames = []
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    else:
+        frames = synthetic_frames(args.frames, args.width, args.height)
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames at {width}x{height}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reference = os.path.join(tmp, 'opencv_mp4v.mp4')
+        bench_writer("OpenCV mp4v", cv2.VideoWriter(reference, cv2.VideoWriter_fourcc(*'mp4v'), 30.0, (width, height)),
+                     frames, reference)
+        for codec in args.codec:
+            for preset in (args.preset if codec in ('libx264', 'libx265') else [None]):
+                path = os.path.join(tmp, f'ffmpeg_{codec}_{preset}.mp4')
+                writer = FFmpegWriter(path, 30.0, (width, height), codec=codec, preset=preset or 'ultrafast')
+                bench_writer(f"ffmpeg {codec} {preset or ''}".rstrip(), writer, frames, path)
+
+        bench_reader("OpenCV VideoCapture", cv2.VideoCapture(reference))
+        bench_reader("ffmpeg pipe", FFmpegReader(reference))
+
+
+if __name__ == '__main__':
+    main()
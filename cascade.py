@@ -0,0 +1,203 @@
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from evaluate import IMAGE_SUFFIXES, ap_per_class, match_predictions, nms, read_labels, split_dirs
+from roi import pack_crops
+
+this_dir = Path(__file__).parent
+LARGE_MODEL_PATH = this_dir / "runs" / "detect" / "train5" / "weights" / "best.pt"
+# Written by distill.py; any yolov8n/s model trained on the same classes works
+SMALL_MODEL_PATH = this_dir / "runs" / "detect" / "student" / "weights" / "best.pt"
+
+
+def to_arrays(result):
+    """(xyxy, conf, cls) numpy arrays of an ultralytics result"""
+    boxes = result.boxes
+    if boxes is None:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, int)
+    return boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy().astype(int)
+
+
+class CascadeDetector:
+    """
+    Two-stage detector: a small model on every frame, the large model only when it is unsure.
+
+    Small-model detections outside the ambiguity band are taken as they are (subject to the
+    final `conf`). If any detection falls inside the band the frame is escalated: in
+    'frame' mode the large model re-runs on the whole frame, in 'crops' mode only on padded crops
+    around the ambiguous boxes (batched at the frame's pixel scale, padded to one shared rectangle), whose detections are merged
+    with the accepted ones through NMS. With a RoiMasker, both stages only see the ROI crops and
+    detections centred outside the polygons are dropped.
+    """
+
+    def __init__(self, small_model, large_model, band=(0.25, 0.6), mode='crops', conf=0.5, iou=0.5,
+                 imgsz=640, crop_pad=0.5, device=None, masker=None, **predict_kwargs):
+        """
+        Args:
+            small_model (YOLO): Fast first-stage model
+            large_model (YOLO): Accurate second-stage model (e.g. the yolov8l best.pt)
+            band (tuple): (low, high) confidence range of the small model that triggers escalation
+            mode (str): 'frame' to re-run the whole frame, 'crops' to re-run only ambiguous regions
+            conf (float): Final confidence threshold
+            iou (float): NMS IoU threshold
+            imgsz (int): Full-frame inference size
+            crop_pad (float): Context added around an ambiguous box, as a fraction of its size
+            device (str): Inference device
+            masker (RoiMasker): Optional ROI restriction for both stages
+            **predict_kwargs: Extra model arguments for both stages (max_det, half, ...)
+        """
+        self.small = small_model
+        self.large = large_model
+        self.band = band
+        self.mode = mode
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+        self.crop_pad = crop_pad
+        self.device = device
+        self.masker = masker
+        self.predict_kwargs = predict_kwargs
+        self.frames = 0
+        self.escalations = 0
+
+    @property
+    def escalation_rate(self):
+        return self.escalations / self.frames if self.frames else 0.0
+
+    def _predict(self, model, source, conf, imgsz):
+        return model(source, conf=conf, iou=self.iou, imgsz=imgsz, device=self.device, verbose=False,
+                     **self.predict_kwargs)
+
+    def _detect_frame(self, model, frame, conf):
+        """(xyxy, conf, cls) of one model on the whole frame, or on its ROI crops"""
+        if self.masker:
+            return self.masker.detect(model, frame, imgsz=self.imgsz, conf=conf, iou=self.iou, device=self.device,
+                                      verbose=False, **self.predict_kwargs)
+        return to_arrays(self._predict(model, frame, conf, self.imgsz)[0])
+
+    def detect(self, frame):
+        """
+        Returns:
+            tuple: (xyxy, conf, cls, escalated) for detections at or above the final threshold
+        """
+        self.frames += 1
+        boxes, confs, clss = self._detect_frame(self.small, frame, min(self.band[0], self.conf))
+        ambiguous = (confs >= self.band[0]) & (confs < self.band[1])
+        if not ambiguous.any():
+            keep = confs >= self.conf
+            return boxes[keep], confs[keep], clss[keep], False
+
+        self.escalations += 1
+        if self.mode == 'frame':
+            boxes, confs, clss = self._detect_frame(self.large, frame, self.conf)
+            return boxes, confs, clss, True
+
+        # Re-check only the ambiguous regions, with some context around each box
+        h, w = frame.shape[:2]
+        crops, origins = [], []
+        for x1, y1, x2, y2 in boxes[ambiguous]:
+            pw, ph = (x2 - x1) * self.crop_pad, (y2 - y1) * self.crop_pad
+            cx1, cy1 = int(max(x1 - pw, 0)), int(max(y1 - ph, 0))
+            cx2, cy2 = int(min(x2 + pw, w)), int(min(y2 + ph, h))
+            crops.append(frame[cy1:cy2, cx1:cx2])
+            origins.append((cx1, cy1))
+        batch, batch_imgsz, gains = pack_crops(crops, self.imgsz / float(max(h, w)))
+
+        accepted = (confs >= self.conf) & ~ambiguous
+        all_boxes, all_confs, all_clss = [boxes[accepted]], [confs[accepted]], [clss[accepted]]
+        results = self._predict(self.large, batch, self.conf, batch_imgsz)
+        for (ox, oy), (gx, gy), result in zip(origins, gains, results):
+            b, c, k = to_arrays(result)
+            all_boxes.append(b / np.array([gx, gy, gx, gy], dtype=b.dtype) + np.array([ox, oy, ox, oy], dtype=b.dtype))
+            all_confs.append(c)
+            all_clss.append(k)
+        boxes = np.concatenate(all_boxes)
+        confs = np.concatenate(all_confs)
+        clss = np.concatenate(all_clss)
+        keep = nms(boxes, confs, clss, self.iou)
+        boxes, confs, clss = boxes[keep], confs[keep], clss[keep]
+        keep = confs >= self.conf
+        if self.masker:
+            # Context around an ambiguous box can reach outside the ROI
+            keep &= self.masker.inside(boxes, frame.shape)
+        return boxes[keep], confs[keep], clss[keep], True
+
+
+def xyxy_to_labels(boxes, confs, clss, width, height):
+    """Pixel xyxy detections -> (N, 6) cls, x, y, w, h, conf normalized rows for evaluate.py"""
+    xywh = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2 / width, (boxes[:, 1] + boxes[:, 3]) / 2 / height,
+                     (boxes[:, 2] - boxes[:, 0]) / width, (boxes[:, 3] - boxes[:, 1]) / height], axis=1)
+    return np.concatenate([clss[:, None], xywh, confs[:, None]], axis=1).astype(np.float64)
+
+
+def report(small_path, large_path, data_config, split='test', band=(0.25, 0.6), mode='crops',
+           conf=0.25, imgsz=640, device=None, limit=None):
+    """
+    Compare small-only, large-only and cascade inference on a split: accuracy, latency, escalation rate
+
+    `conf` is kept low (as in validation) so the mAP numbers cover the whole PR curve.
+    """
+    from ultralytics import YOLO
+
+    images_dir, labels_dir, names = split_dirs(data_config, split)
+    images = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:limit]
+    small, large = YOLO(str(small_path)), YOLO(str(large_path))
+    cascade = CascadeDetector(small, large, band=band, mode=mode, conf=conf, imgsz=imgsz, device=device)
+
+    # Warm up both models so the first image does not carry initialization cost
+    warmup = cv2.imread(str(images[0]))
+    for model in (small, large):
+        model(warmup, imgsz=imgsz, device=device, verbose=False)
+
+    methods = {
+        'small': lambda f: to_arrays(small(f, conf=conf, imgsz=imgsz, device=device, verbose=False)[0]),
+        'large': lambda f: to_arrays(large(f, conf=conf, imgsz=imgsz, device=device, verbose=False)[0]),
+        f'cascade ({mode})': lambda f: cascade.detect(f)[:3],
+    }
+    stats = {name: {'tp': [], 'conf': [], 'cls': [], 'latency': []} for name in methods}
+    gt_cls = []
+    for path in images:
+        frame = cv2.imread(str(path))
+        h, w = frame.shape[:2]
+        gt = read_labels(str(Path(labels_dir) / f'{path.stem}.txt'), with_conf=False)
+        gt_cls.append(gt[:, 0].astype(int))
+        for name, run in methods.items():
+            start = time.perf_counter()
+            boxes, confs, clss = run(frame)
+            stats[name]['latency'].append(time.perf_counter() - start)
+            pred = xyxy_to_labels(boxes, confs, clss, w, h)
+            stats[name]['tp'].append(match_predictions(pred, gt))
+            stats[name]['conf'].append(pred[:, 5])
+            stats[name]['cls'].append(pred[:, 0].astype(int))
+
+    gt_cls = np.concatenate(gt_cls)
+    print(f"{len(images)} images, band {band[0]:.2f}-{band[1]:.2f}, escalation rate {cascade.escalation_rate:.1%}")
+    print(f"{'Method':>20}{'mAP50':>9}{'mAP50-95':>10}{'mean ms':>10}{'p95 ms':>9}{'FPS':>8}")
+    for name, s in stats.items():
+        metrics = ap_per_class(np.concatenate(s['tp']), np.concatenate(s['conf']), np.concatenate(s['cls']),
+                               gt_cls, len(names))
+        valid = metrics['n_gt'] > 0
+        latency = np.array(s['latency']) * 1000
+        print(f"{name:>20}{metrics['ap'][valid, 0].mean():>9.3f}{metrics['ap'][valid].mean():>10.3f}"
+              f"{latency.mean():>10.1f}{np.percentile(latency, 95):>9.1f}{1000 / latency.mean():>8.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Small-then-large cascade: escalation and accuracy-vs-latency report")
+    parser.add_argument('--small', type=str, default=str(SMALL_MODEL_PATH), help='First-stage (nano/small) model')
+    parser.add_argument('--large', type=str, default=str(LARGE_MODEL_PATH), help='Second-stage model')
+    parser.add_argument('--data', type=str, default=str(this_dir / 'yolo_params.yaml'), help='Dataset config')
+    parser.add_argument('--split', type=str, default='test', help='Split to report on (default: test)')
+    parser.add_argument('--band', type=float, nargs=2, default=[0.25, 0.6], help='Ambiguity band (default: 0.25 0.6)')
+    parser.add_argument('--mode', type=str, default='crops', choices=['crops', 'frame'], help='Escalation mode')
+    parser.add_argument('--conf', type=float, default=0.25, help='Final confidence threshold for the report')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference size (default: 640)')
+    parser.add_argument('--device', type=str, default=None, help='Device, e.g. 0 or cpu (default: auto)')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N images')
+    args = parser.parse_args()
+    report(args.small, args.large, args.data, args.split, tuple(args.band), args.mode, args.conf,
+           args.imgsz, args.device, args.limit)
@@ -1,17 +1,24 @@
 import cv2
 from ultralytics import YOLO
 import os
+from renderer import Renderer
+from video_io import open_video_reader, open_video_writer
 
 # Paths
 VIDEO_PATH = r'C:\Users\Ankur Rawat\Downloads\Duality_AI_Task\Duality_ai\Image to video 丨 First-person POV of astronaut fast-walking through ISS corridor.mp4'
 MODEL_PATH = r'C:\Users\Ankur Rawat\Downloads\Duality_AI_Task\Duality_ai\runs\detect\train5\weights\best.pt'
 OUTPUT_PATH = 'output_detected_video.mp4'
 
+# Video I/O backend: 'opencv' (mp4v) or 'ffmpeg' (decode/encode in ffmpeg subprocesses, e.g. H.264 ultrafast)
+VIDEO_IO = 'opencv'
+CODEC = 'libx264'
+PRESET = 'ultrafast'
+
 # Load YOLOv8 model
 model = YOLO(MODEL_PATH)
 
 # Open video
-cap = cv2.VideoCapture(VIDEO_PATH)
+cap = open_video_reader(VIDEO_PATH, VIDEO_IO)
 if not cap.isOpened():
     print(f"Error opening video file: {VIDEO_PATH}")
     exit(1)
@@ -20,8 +27,7 @@ if not cap.isOpened():
 fps = cap.get(cv2.CAP_PROP_FPS)
 width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
 height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-out = cv2.VideoWriter(OUTPUT_PATH, fourcc, fps, (width, height))
+out = open_video_writer(OUTPUT_PATH, fps, (width, height), VIDEO_IO, CODEC, PRESET)
 
 # Get class names from classes.txt if available
 class_names = None
@@ -29,16 +35,11 @@ if os.path.exists('classes.txt'):
     with open('classes.txt', 'r') as f:
         class_names = [line.strip() for line in f.readlines()]
 
+renderer = Renderer(class_names or [], colors=[(0, 255, 0)] * len(class_names or []), label_fmt='{name}: {conf:.2f}')
+
 def draw_boxes(frame, results):
-    for box in results.boxes:
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        conf = float(box.conf[0])
-        cls = int(box.cls[0])
-        label = f"{class_names[cls] if class_names else cls}: {conf:.2f}"
-        color = (0, 255, 0)
-        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-    return frame
+    boxes = results.boxes
+    return renderer.draw(frame, boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy())
 
 print("Starting detection...")
 frame_count = 0
@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+import yaml
+from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils.torch_utils import de_parallel
+
+from evaluate import IMAGE_SUFFIXES, box_iou, read_labels, split_dirs, xywh2xyxy
+from train import TRAIN_ARGS
+
+this_dir = Path(__file__).parent
+TEACHER_PATH = this_dir / "runs" / "detect" / "train5" / "weights" / "best.pt"
+DISTILL_DIR = this_dir / "data" / "distill"
+
+# Student training overrides on top of train.py's TRAIN_ARGS
+STUDENT_ARGS = dict(
+    model="yolov8n.pt",
+    project=str(this_dir / "runs" / "detect"),
+    name="student",
+    exist_ok=True,
+    mixup=0.0,
+)
+
+# Weight of the distillation term relative to the regular detection loss, and its temperature
+KD_WEIGHT = 1.0
+KD_TEMPERATURE = 2.0
+
+# Tiny CPU configuration to check the whole workflow end to end
+SMOKE_ARGS = dict(epochs=1, imgsz=320, batch=4, device="cpu", workers=0, mosaic=0.0, plots=False)
+SMOKE_IMAGES = {"train": 32, "val": 16, "test": 16}
+
+
+def link_or_copy(src, dst):
+    """Symlink an image into the distillation dataset, copying where symlinks are not allowed"""
+    if dst.exists():
+        return
+    try:
+        os.symlink(os.path.abspath(src), dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def teacher_labels(teacher, images, conf, imgsz, device):
+    """Yield (image_path, (N, 6) cls, x, y, w, h, conf) teacher predictions, normalized"""
+    for path, result in zip(images, teacher.predict([str(p) for p in images], stream=True, conf=conf,
+                                                    imgsz=imgsz, device=device, verbose=False)):
+        boxes = result.boxes
+        pred = np.concatenate([boxes.cls.cpu().numpy()[:, None], boxes.xywhn.cpu().numpy(),
+                               boxes.conf.cpu().numpy()[:, None]], axis=1) if len(boxes) else np.zeros((0, 6))
+        yield path, pred
+
+
+def merge_labels(gt, pred, iou_threshold=0.5):
+    """Ground truth plus teacher boxes that do not overlap a ground-truth box of the same class"""
+    if len(pred) == 0 or len(gt) == 0:
+        return gt if len(gt) else pred[:, :5]
+    iou = box_iou(xywh2xyxy(pred[:, 1:5]), xywh2xyxy(gt[:, 1:5]))
+    iou = iou * (pred[:, None, 0] == gt[None, :, 0])
+    extra = pred[iou.max(axis=1) < iou_threshold, :5]
+    return np.concatenate([gt, extra])
+
+
+def build_dataset(teacher, data_config, out_dir, conf=0.35, mode="gt", unlabeled=None, imgsz=640,
+                  device=None, limits=None):
+    """
+    Write the student's copy of the train/val splits (images symlinked) and its dataset yaml
+
+    The teacher was trained on the same train split, so on those images it mostly reproduces
+    the ground truth: 'merge' only adds the boxes it disagrees with (largely its false
+    positives there). Its knowledge reaches the student through the distillation loss
+    (DistillationTrainer) and through labelling the `unlabeled` images.
+
+    Args:
+        teacher (YOLO): Trained teacher model
+        data_config (str): Original yolo_params.yaml
+        out_dir (Path): Where the distillation dataset is written
+        conf (float): Teacher confidence threshold for pseudo-labels
+        mode (str): 'gt' keeps the ground truth of labelled images, 'merge' adds teacher boxes
+            the ground truth lacks, 'teacher' uses teacher boxes only; unlabeled images always
+            get teacher boxes
+        unlabeled (str): Optional directory of extra images, labelled by the teacher only
+        imgsz (int): Teacher inference size
+        device (str): Teacher device
+        limits (dict): Optional per-split image limits (smoke runs)
+
+    Returns:
+        Path: The dataset yaml for student training
+    """
+    out_dir = Path(out_dir)
+    with open(data_config, "r") as f:
+        data = yaml.safe_load(f)
+
+    added = 0
+    for split in ("train", "val"):
+        images_dir, labels_dir, _ = split_dirs(data_config, split)
+        images = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if split == "train" and unlabeled:
+            images += sorted(p for p in Path(unlabeled).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if limits and split in limits:
+            images = images[:limits[split]]
+        # Rebuilt every run, so images and labels of an earlier (e.g. full or --unlabeled) run never leak in
+        shutil.rmtree(out_dir / split, ignore_errors=True)
+        (out_dir / split / "images").mkdir(parents=True, exist_ok=True)
+        (out_dir / split / "labels").mkdir(parents=True, exist_ok=True)
+
+        # Validation keeps the true labels so student checkpoints are selected on real accuracy
+        if split == "val":
+            for path in images:
+                link_or_copy(path, out_dir / split / "images" / path.name)
+                gt_path = Path(labels_dir) / f"{path.stem}.txt"
+                if gt_path.exists():
+                    shutil.copy2(gt_path, out_dir / split / "labels" / gt_path.name)
+            continue
+
+        pseudo = []
+        for path in images:
+            link_or_copy(path, out_dir / split / "images" / path.name)
+            gt_path = Path(labels_dir) / f"{path.stem}.txt"
+            if mode == "gt" and gt_path.exists() and Path(path).parent == Path(images_dir):
+                shutil.copy2(gt_path, out_dir / split / "labels" / gt_path.name)
+            else:
+                pseudo.append(path)
+
+        for path, pred in teacher_labels(teacher, pseudo, conf, imgsz, device):
+            gt_path = Path(labels_dir) / f"{path.stem}.txt"
+            has_gt = gt_path.exists() and Path(path).parent == Path(images_dir)
+            if mode == "merge" and has_gt:
+                gt = read_labels(str(gt_path), with_conf=False)
+                labels = merge_labels(gt, pred)
+                added += len(labels) - len(gt)
+            else:
+                labels = pred[:, :5]
+            np.savetxt(out_dir / split / "labels" / f"{path.stem}.txt", labels, fmt="%d %.6f %.6f %.6f %.6f")
+
+    config = {
+        "path": str(out_dir.resolve()),
+        "train": "train/images",
+        "val": "val/images",
+        "nc": data["nc"],
+        "names": data["names"],
+    }
+    config_path = out_dir / "distill.yaml"
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    print(f"Distillation dataset written to {out_dir} ({added} teacher boxes added to ground truth, "
+          f"{len(pseudo)} training images labelled by the teacher)")
+    return config_path
+
+
+def distillation_loss(student_feats, teacher_feats, reg_max, temperature=KD_TEMPERATURE):
+    """
+    Logit distillation between two YOLOv8 heads with the same layout (strides, classes, reg_max)
+
+    Class scores follow the teacher's sigmoid probabilities (BCE) at every cell. The four box
+    side distributions follow the teacher's softmax (KL at `temperature`), weighted by the
+    teacher's top class probability so that background cells do not dominate.
+    """
+    total = 0.0
+    for s, t in zip(student_feats, teacher_feats):
+        s, t = s.float(), t.float()
+        b, _, h, w = s.shape
+        s_box, s_cls = s.split((4 * reg_max, s.shape[1] - 4 * reg_max), 1)
+        t_box, t_cls = t.split((4 * reg_max, t.shape[1] - 4 * reg_max), 1)
+        t_prob = t_cls.sigmoid()
+        cls_loss = F.binary_cross_entropy_with_logits(s_cls, t_prob)
+
+        s_log = F.log_softmax(s_box.view(b, 4, reg_max, h, w) / temperature, 2)
+        t_log = F.log_softmax(t_box.view(b, 4, reg_max, h, w) / temperature, 2)
+        kl = F.kl_div(s_log, t_log, reduction="none", log_target=True).sum(2).mean(1) * temperature ** 2
+        weight = t_prob.amax(1)
+        box_loss = (kl * weight).sum() / weight.sum().clamp(min=1e-6)
+        total = total + cls_loss + box_loss
+    return total / len(student_feats)
+
+
+class DistillationLoss:
+    """The student's regular detection loss plus `weight` x distillation_loss towards a frozen teacher"""
+
+    def __init__(self, criterion, teacher, weight=KD_WEIGHT, temperature=KD_TEMPERATURE):
+        self.criterion = criterion
+        self.teacher = teacher
+        self.weight = weight
+        self.temperature = temperature
+        self.kd_total = 0.0
+        self.steps = 0
+
+    def __call__(self, preds, batch):
+        loss, loss_items = self.criterion(preds, batch)
+        feats = preds[1] if isinstance(preds, tuple) else preds
+        with torch.no_grad():
+            # In eval mode the Detect head returns (decoded, raw per-level outputs)
+            teacher_feats = self.teacher(batch["img"])[1]
+        for s, t in zip(feats, teacher_feats):
+            if s.shape != t.shape:
+                raise ValueError(f"Teacher and student heads differ ({tuple(t.shape)} vs {tuple(s.shape)}); "
+                                 "both must be YOLOv8 detectors trained on the same classes")
+        kd = distillation_loss(feats, teacher_feats, self.criterion.reg_max, self.temperature)
+        self.kd_total += float(kd.detach())
+        self.steps += 1
+        # Like the detection loss, the distillation term is scaled by the batch size
+        return loss + self.weight * kd * batch["img"].shape[0], loss_items
+
+
+def _attach_teacher(trainer):
+    """on_pretrain_routine_end: the model has its hyperparameters and device now, and the EMA copy
+    (which is what gets saved) was already made, so checkpoints never reference the teacher"""
+    model = de_parallel(trainer.model)
+    teacher = YOLO(str(trainer.teacher_path)).model.float().to(trainer.device).eval()
+    for p in teacher.parameters():
+        p.requires_grad = False
+    model.criterion = DistillationLoss(model.init_criterion(), teacher, trainer.kd_weight, trainer.kd_temperature)
+    print(f"Distilling from {trainer.teacher_path} (weight {trainer.kd_weight}, temperature {trainer.kd_temperature})")
+
+
+def _log_distillation(trainer):
+    criterion = de_parallel(trainer.model).criterion
+    if isinstance(criterion, DistillationLoss) and criterion.steps:
+        print(f"Epoch {trainer.epoch + 1}: mean distillation loss {criterion.kd_total / criterion.steps:.4f}")
+        criterion.kd_total, criterion.steps = 0.0, 0
+
+
+class DistillationTrainer(DetectionTrainer):
+    """DetectionTrainer whose training loss adds logit distillation from a frozen teacher (DistillationLoss)"""
+
+    teacher_path = TEACHER_PATH
+    kd_weight = KD_WEIGHT
+    kd_temperature = KD_TEMPERATURE
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_callback("on_pretrain_routine_end", _attach_teacher)
+        self.add_callback("on_train_epoch_end", _log_distillation)
+
+
+def cpu_latency(model, images, imgsz, runs=1):
+    """Mean and p95 single-image CPU latency in ms (after one warm-up call)"""
+    frames = [cv2.imread(str(p)) for p in images]
+    model(frames[0], imgsz=imgsz, device="cpu", verbose=False)
+    times = []
+    for _ in range(runs):
+        for frame in frames:
+            start = time.perf_counter()
+            model(frame, imgsz=imgsz, device="cpu", verbose=False)
+            times.append((time.perf_counter() - start) * 1000)
+    times = np.array(times)
+    return float(times.mean()), float(np.percentile(times, 95))
+
+
+def subset_config(data_config, split, limit, out_dir):
+    """Dataset yaml whose `split` holds only the first `limit` images (with labels) of the original split"""
+    images_dir, labels_dir, names = split_dirs(data_config, split)
+    out_dir = Path(out_dir)
+    shutil.rmtree(out_dir / split, ignore_errors=True)
+    (out_dir / split / "images").mkdir(parents=True)
+    (out_dir / split / "labels").mkdir(parents=True)
+    images = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:limit]
+    for path in images:
+        link_or_copy(path, out_dir / split / "images" / path.name)
+        label = Path(labels_dir) / f"{path.stem}.txt"
+        if label.exists():
+            shutil.copy2(label, out_dir / split / "labels" / label.name)
+    # ultralytics expects train/val keys even when only `split` is evaluated
+    config = {"path": str(out_dir.resolve()), "train": f"{split}/images", "val": f"{split}/images",
+              split: f"{split}/images", "nc": len(names), "names": names}
+    config_path = out_dir / f"{split}_subset.yaml"
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+def compare(teacher, student, data_config, split, imgsz, report_path, limit=None, work_dir=DISTILL_DIR):
+    """
+    Teacher vs student accuracy (model.val on the split) and CPU latency; writes a JSON report
+
+    With `limit` both the evaluation and the latency run only use the first `limit` images of
+    the split (smoke runs); otherwise latency is measured on the first 100.
+    """
+    if limit:
+        data_config = subset_config(data_config, split, limit, Path(work_dir) / "eval")
+    images_dir, _, _ = split_dirs(data_config, split)
+    images = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)[:limit or 100]
+    report = {}
+    for name, model in (("teacher", teacher), ("student", student)):
+        metrics = model.val(data=str(data_config), split=split, imgsz=imgsz, device="cpu", plots=False, verbose=False)
+        mean_ms, p95_ms = cpu_latency(model, images, imgsz)
+        report[name] = {"mAP50": float(metrics.box.map50), "mAP50-95": float(metrics.box.map),
+                        "cpu_ms": mean_ms, "cpu_p95_ms": p95_ms, "cpu_fps": 1000 / mean_ms}
+    report["mAP50-95_retained"] = report["student"]["mAP50-95"] / max(report["teacher"]["mAP50-95"], 1e-9)
+    report["cpu_speedup"] = report["teacher"]["cpu_ms"] / report["student"]["cpu_ms"]
+
+    print(f"{'Model':>10}{'mAP50':>9}{'mAP50-95':>10}{'CPU ms':>9}{'p95 ms':>9}{'CPU FPS':>9}")
+    for name in ("teacher", "student"):
+        r = report[name]
+        print(f"{name:>10}{r['mAP50']:>9.3f}{r['mAP50-95']:>10.3f}{r['cpu_ms']:>9.1f}{r['cpu_p95_ms']:>9.1f}{r['cpu_fps']:>9.1f}")
+    print(f"Student keeps {report['mAP50-95_retained']:.1%} of teacher mAP50-95 at {report['cpu_speedup']:.1f}x CPU throughput")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {report_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distil the yolov8l teacher into a CPU-friendly yolov8n/s student")
+    parser.add_argument("--teacher", type=str, default=str(TEACHER_PATH), help="Teacher weights (default: train5 best.pt)")
+    parser.add_argument("--student", type=str, default=STUDENT_ARGS["model"], help="Student base model (yolov8n.pt or yolov8s.pt)")
+    parser.add_argument("--data", type=str, default=TRAIN_ARGS["data"], help="Dataset config")
+    parser.add_argument("--out", type=str, default=str(DISTILL_DIR), help="Distillation dataset directory")
+    parser.add_argument("--mode", type=str, default="gt", choices=["gt", "merge", "teacher"],
+                        help="Labels of the train images: gt: ground truth (default); merge: ground truth + teacher boxes "
+                             "it lacks; teacher: teacher labels only. --unlabeled images always get teacher labels")
+    parser.add_argument("--pseudo-conf", type=float, default=0.35, help="Teacher confidence for pseudo-labels (default: 0.35)")
+    parser.add_argument("--unlabeled", type=str, default=None, help="Extra unlabeled images to label with the teacher")
+    parser.add_argument("--kd-weight", type=float, default=KD_WEIGHT, help=f"Distillation loss weight, 0 to train on labels only (default: {KD_WEIGHT})")
+    parser.add_argument("--kd-temperature", type=float, default=KD_TEMPERATURE, help=f"Distillation temperature (default: {KD_TEMPERATURE})")
+    parser.add_argument("--epochs", type=int, default=None, help="Override TRAIN_ARGS epochs")
+    parser.add_argument("--device", type=str, default=None, help="Training device (default: TRAIN_ARGS device)")
+    parser.add_argument("--smoke", action="store_true", help="Tiny CPU run (1 epoch, 320px, a few images) to check the workflow")
+    args = parser.parse_args()
+
+    train_args = {**TRAIN_ARGS, **STUDENT_ARGS, "model": args.student}
+    limits = None
+    if args.smoke:
+        train_args.update(SMOKE_ARGS)
+        limits = SMOKE_IMAGES
+    if args.epochs:
+        train_args["epochs"] = args.epochs
+    if args.device:
+        train_args["device"] = args.device
+
+    teacher = YOLO(args.teacher)
+    data_yaml = build_dataset(teacher, args.data, args.out, conf=args.pseudo_conf, mode=args.mode,
+                              unlabeled=args.unlabeled, imgsz=train_args["imgsz"],
+                              device=train_args["device"], limits=limits)
+
+    train_args["data"] = str(data_yaml)
+    student = YOLO(train_args.pop("model"))
+    trainer = None
+    if args.kd_weight > 0:
+        DistillationTrainer.teacher_path = args.teacher
+        DistillationTrainer.kd_weight = args.kd_weight
+        DistillationTrainer.kd_temperature = args.kd_temperature
+        trainer = DistillationTrainer
+    student.train(trainer=trainer, **train_args)
+
+    student_dir = Path(train_args["project"]) / train_args["name"]
+    student = YOLO(str(student_dir / "weights" / "best.pt"))
+    compare(teacher, student, args.data, "test", train_args["imgsz"], student_dir / "distill_report.json",
+            limit=SMOKE_IMAGES["test"] if args.smoke else None, work_dir=args.out)
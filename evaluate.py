@@ -0,0 +1,227 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+# COCO-style IoU thresholds for mAP@0.5:0.95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp')
+# np.trapz was renamed in NumPy 2
+trapezoid = getattr(np, 'trapezoid', None) or np.trapz
+
+
+def read_labels(path, with_conf):
+    """Read a YOLO label file into an (N, 5) or (N, 6) float array (cls, x, y, w, h[, conf])"""
+    cols = 6 if with_conf else 5
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros((0, cols), dtype=np.float64)
+    data = np.loadtxt(path, ndmin=2, dtype=np.float64)
+    if with_conf and data.shape[1] == 5:
+        # Label files written without confidences rank every prediction equally
+        data = np.hstack([data, np.ones((len(data), 1))])
+    return data[:, :cols]
+
+
+def xywh2xyxy(xywh):
+    xy, wh = xywh[:, :2], xywh[:, 2:4] / 2
+    return np.hstack([xy - wh, xy + wh])
+
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def nms(boxes, confs, clss, iou_threshold):
+    """Class-aware greedy NMS on (N, 4) xyxy boxes (any units); returns kept indices, highest confidence first"""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+    # Shift each class into its own region so boxes of different classes never overlap
+    shifted = boxes + np.asarray(clss)[:, None] * (boxes.max() - boxes.min() + 1)
+    idx = np.argsort(-np.asarray(confs), kind='stable')
+    keep = []
+    while len(idx):
+        i = idx[0]
+        keep.append(i)
+        if len(idx) == 1:
+            break
+        iou = box_iou(shifted[i:i + 1], shifted[idx[1:]])[0]
+        idx = idx[1:][iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+def normalize_pixels(pred, image_path):
+    """Older predict.py label files hold pixel xywh; scale them by the image size"""
+    if len(pred) == 0 or pred[:, 1:5].max() <= 1.5 or image_path is None:
+        return pred
+    import cv2
+    image = cv2.imread(str(image_path))
+    if image is None:
+        return pred
+    h, w = image.shape[:2]
+    pred = pred.copy()
+    pred[:, [1, 3]] /= w
+    pred[:, [2, 4]] /= h
+    return pred
+
+
+def match_predictions(pred, gt):
+    """
+    Match predictions (N, 6: cls, x, y, w, h, conf) to ground truth (M, 5) at every IoU threshold
+
+    Returns:
+        numpy.ndarray: (N, 10) bool, True where the prediction is a true positive at that threshold
+    """
+    tp = np.zeros((len(pred), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(pred) and len(gt):
+        iou = box_iou(xywh2xyxy(pred[:, 1:5]), xywh2xyxy(gt[:, 1:5]))
+        iou = iou * (pred[:, None, 0] == gt[None, :, 0])
+        for i, t in enumerate(IOU_THRESHOLDS):
+            p, g = np.nonzero(iou >= t)
+            if len(p) == 0:
+                continue
+            # Greedy one-to-one matching, highest IoU first
+            order = np.argsort(-iou[p, g], kind='stable')
+            p, g = p[order], g[order]
+            _, first = np.unique(g, return_index=True)
+            p, g = p[np.sort(first)], g[np.sort(first)]
+            _, first = np.unique(p, return_index=True)
+            tp[p[first], i] = True
+    return tp
+
+
+def match_image(args):
+    """
+    Match one image's prediction file to its ground truth file at every IoU threshold
+
+    Returns:
+        tuple: (tp (N, 10) bool, conf (N,), pred_cls (N,), gt_cls (M,))
+    """
+    pred_path, gt_path, image_path = args
+    pred = normalize_pixels(read_labels(pred_path, with_conf=True), image_path)
+    gt = read_labels(gt_path, with_conf=False)
+    return match_predictions(pred, gt), pred[:, 5], pred[:, 0].astype(int), gt[:, 0].astype(int)
+
+
+def compute_ap(recall, precision):
+    """Area under the precision envelope with 101-point (COCO) interpolation"""
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    x = np.linspace(0, 1, 101)
+    return trapezoid(np.interp(x, mrec, mpre), x)
+
+
+def ap_per_class(tp, conf, pred_cls, gt_cls, num_classes):
+    """
+    Per-class precision/recall at the max-F1 confidence and AP at every IoU threshold
+
+    Returns:
+        dict: p, r, f1 (num_classes,), ap (num_classes, 10), conf (best confidence), n_gt (num_classes,)
+    """
+    order = np.argsort(-conf, kind='stable')
+    tp, conf, pred_cls = tp[order], conf[order], pred_cls[order]
+    n_gt = np.bincount(gt_cls, minlength=num_classes)[:num_classes]
+
+    px = np.linspace(0, 1, 1000)
+    p_curve = np.zeros((num_classes, len(px)))
+    r_curve = np.zeros((num_classes, len(px)))
+    ap = np.zeros((num_classes, tp.shape[1]))
+    for c in range(num_classes):
+        mask = pred_cls == c
+        if n_gt[c] == 0 or not mask.any():
+            continue
+        tpc = tp[mask].cumsum(0)
+        fpc = (~tp[mask]).cumsum(0)
+        recall = tpc / (n_gt[c] + 1e-16)
+        precision = tpc / (tpc + fpc)
+        # Curves at the IoU=0.5 threshold, sampled on a confidence grid (conf is descending)
+        r_curve[c] = np.interp(-px, -conf[mask], recall[:, 0], left=0)
+        p_curve[c] = np.interp(-px, -conf[mask], precision[:, 0], left=1)
+        for j in range(tp.shape[1]):
+            ap[c, j] = compute_ap(recall[:, j], precision[:, j])
+
+    f1_curve = 2 * p_curve * r_curve / (p_curve + r_curve + 1e-16)
+    best = int(f1_curve.mean(0).argmax())
+    return {'p': p_curve[:, best], 'r': r_curve[:, best], 'f1': f1_curve[:, best], 'ap': ap,
+            'conf': float(px[best]), 'n_gt': n_gt, 'px': px, 'p_curve': p_curve, 'r_curve': r_curve}
+
+
+def split_dirs(data_config, split):
+    """Return (images_dir, labels_dir, class names) of a split in yolo_params.yaml"""
+    with open(data_config, 'r') as f:
+        data = yaml.safe_load(f)
+    if data.get(split) is None:
+        raise ValueError(f"No {split} field found in {data_config}")
+    root = Path(data_config).parent
+    split_dir = root / data[split]
+    # train/val point at .../images, test at the split root
+    if split_dir.name == 'images':
+        split_dir = split_dir.parent
+    return split_dir / 'images', split_dir / 'labels', data.get('names', [])
+
+
+def collect_stats(pred_dir, images_dir, labels_dir, workers=None):
+    """Match every image of the split in parallel and concatenate the per-image statistics"""
+    images = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    jobs = [(str(Path(pred_dir) / f'{p.stem}.txt'), str(Path(labels_dir) / f'{p.stem}.txt'), str(p)) for p in images]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        stats = list(pool.map(match_image, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+    tp = np.concatenate([s[0] for s in stats]) if stats else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool)
+    conf = np.concatenate([s[1] for s in stats]) if stats else np.zeros(0)
+    pred_cls = np.concatenate([s[2] for s in stats]) if stats else np.zeros(0, dtype=int)
+    gt_cls = np.concatenate([s[3] for s in stats]) if stats else np.zeros(0, dtype=int)
+    return len(images), tp, conf, pred_cls, gt_cls
+
+
+def print_metrics(names, num_images, metrics):
+    print(f"{'Class':>20}{'Images':>10}{'Instances':>11}{'P':>10}{'R':>10}{'mAP50':>10}{'mAP50-95':>10}")
+    n_gt = metrics['n_gt']
+    ap = metrics['ap']
+    valid = n_gt > 0
+    print(f"{'all':>20}{num_images:>10}{int(n_gt.sum()):>11}"
+          f"{metrics['p'][valid].mean() if valid.any() else 0:>10.3f}{metrics['r'][valid].mean() if valid.any() else 0:>10.3f}"
+          f"{ap[valid, 0].mean() if valid.any() else 0:>10.3f}{ap[valid].mean() if valid.any() else 0:>10.3f}")
+    for c, name in enumerate(names):
+        print(f"{name:>20}{num_images:>10}{int(n_gt[c]):>11}{metrics['p'][c]:>10.3f}{metrics['r'][c]:>10.3f}"
+              f"{ap[c, 0]:>10.3f}{ap[c].mean():>10.3f}")
+
+
+def evaluate(pred_dir, data_config, split='test', workers=None):
+    """
+    Evaluate saved prediction label files against a split's ground truth without running the model
+
+    Args:
+        pred_dir (str): Directory with one `cls x y w h conf` file per image (normalized coordinates)
+        data_config (str): Path to yolo_params.yaml
+        split (str): Split to evaluate against
+        workers (int): Worker processes (default: all cores)
+
+    Returns:
+        dict: Per-class metrics (see ap_per_class)
+    """
+    images_dir, labels_dir, names = split_dirs(data_config, split)
+    num_images, tp, conf, pred_cls, gt_cls = collect_stats(pred_dir, images_dir, labels_dir, workers)
+    metrics = ap_per_class(tp, conf, pred_cls, gt_cls, len(names))
+    print_metrics(names, num_images, metrics)
+    return metrics
+
+
+if __name__ == '__main__':
+    this_dir = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Offline precision/recall/mAP from saved prediction label files")
+    parser.add_argument('--pred', type=str, default=str(this_dir / 'predictions' / 'labels'),
+                        help='Prediction label directory (default: predictions/labels)')
+    parser.add_argument('--data', type=str, default=str(this_dir / 'yolo_params.yaml'), help='Dataset config')
+    parser.add_argument('--split', type=str, default='test', help='Split to evaluate against (default: test)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    args = parser.parse_args()
+    evaluate(args.pred, args.data, args.split, args.workers)
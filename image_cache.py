@@ -0,0 +1,193 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+# Decoded training images are stored here, one store per image list and size
+CACHE_DIR = Path(__file__).parent / "data" / "cache"
+
+
+def resize_long_side(im, imgsz):
+    """Resize so the long side equals imgsz, exactly like ultralytics' rect-mode load_image"""
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return im
+
+
+def _fill(args):
+    """Decode, resize and append a chunk of images to its own part file (runs in a worker process)"""
+    path, imgsz, rows = args
+    sizes = []
+    with open(path, "wb") as f:
+        for row, file in rows:
+            im = cv2.imread(file)
+            if im is None:
+                raise FileNotFoundError(f"Image not found or unreadable: {file}")
+            h0, w0 = im.shape[:2]
+            im = resize_long_side(im, imgsz)
+            h, w = im.shape[:2]
+            f.write(np.ascontiguousarray(im).tobytes())
+            sizes.append((row, h0, w0, h, w))
+    return sizes
+
+
+class ImageCache:
+    """
+    Memory-mapped store of decoded, resized training images.
+
+    Every image is decoded once, resized so its long side is `imgsz` and its pixels are written
+    back to back into one uint8 file, so the store takes about h * w * 3 bytes per image (at
+    most 1.2 MB at 640, less for non-square images); meta.json records each file's original and
+    resized size, from which the row offsets follow, plus its mtime. The store is reused by later
+    epochs and later runs as long as the file list, mtimes and size still match, and dataloader
+    workers share it through the OS page cache instead of each keeping decoded copies in RAM.
+    The memmap is opened lazily in every process, so datasets holding a cache pickle cheaply to
+    spawned workers (Windows).
+    """
+
+    def __init__(self, root, files, imgsz):
+        self.root = Path(root)
+        self.files = [str(f) for f in files]
+        self.imgsz = imgsz
+        self.path = self.root / "images.u8"
+        self.meta_path = self.root / "meta.json"
+        self.orig_hw = None
+        self.hw = None
+        self.offsets = None
+        self._images = None
+
+    @classmethod
+    def for_files(cls, files, imgsz, cache_dir=CACHE_DIR):
+        """Store for an image list under cache_dir, named after a hash of the list and size"""
+        key = hashlib.md5("\n".join(map(str, files)).encode()).hexdigest()[:12]
+        return cls(Path(cache_dir) / f"{key}_{imgsz}", files, imgsz)
+
+    def _signature(self):
+        return [os.path.getmtime(f) for f in self.files]
+
+    def load(self):
+        """Use the existing store if it matches the current files; returns True on success"""
+        if not (self.meta_path.exists() and self.path.exists()):
+            return False
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        if (meta.get("layout") != "packed" or meta["imgsz"] != self.imgsz or meta["files"] != self.files
+                or meta["mtimes"] != self._signature()):
+            return False
+        self.orig_hw = np.array(meta["orig_hw"], dtype=np.int32).reshape(-1, 2)
+        self.hw = np.array(meta["hw"], dtype=np.int32).reshape(-1, 2)
+        self._set_offsets()
+        return True
+
+    def _set_offsets(self):
+        """Start of every row in the store (plus the total size at the end)"""
+        rows = self.hw.astype(np.int64).prod(axis=1) * 3
+        self.offsets = np.concatenate([[0], np.cumsum(rows)]).astype(np.int64)
+
+    def build(self, workers=None):
+        """Decode and resize every image into the store in parallel"""
+        start = time.time()
+        self.root.mkdir(parents=True, exist_ok=True)
+        count = len(self.files)
+        self.meta_path.unlink(missing_ok=True)
+
+        # Rows are written to one part file per chunk (chunks are consecutive rows), then concatenated
+        workers = workers or os.cpu_count() or 1
+        rows = list(enumerate(self.files))
+        chunk = max(1, math.ceil(count / (4 * workers)))
+        parts = [self.root / f"part_{i // chunk}.u8" for i in range(0, count, chunk)]
+        jobs = [(str(part), self.imgsz, rows[i:i + chunk]) for part, i in zip(parts, range(0, count, chunk))]
+        self.orig_hw = np.zeros((count, 2), dtype=np.int32)
+        self.hw = np.zeros((count, 2), dtype=np.int32)
+        if jobs:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+                for sizes in pool.map(_fill, jobs):
+                    for row, h0, w0, h, w in sizes:
+                        self.orig_hw[row] = h0, w0
+                        self.hw[row] = h, w
+        with open(self.path, "wb") as out:
+            for part in parts:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out, 16 << 20)
+                part.unlink()
+        self._set_offsets()
+        self._images = None
+
+        # meta.json is written last, so an interrupted build is never mistaken for a complete one
+        with open(self.meta_path, "w") as f:
+            json.dump({"layout": "packed", "imgsz": self.imgsz, "files": self.files, "mtimes": self._signature(),
+                       "orig_hw": self.orig_hw.tolist(), "hw": self.hw.tolist()}, f)
+        size_gb = self.path.stat().st_size / 1e9
+        print(f"Cached {count} images at {self.imgsz}px in {self.root} ({size_gb:.1f} GB, {time.time() - start:.1f}s)")
+
+    def load_or_build(self, workers=None):
+        if not self.load():
+            self.build(workers)
+        return self
+
+    @property
+    def images(self):
+        if self._images is None:
+            # An empty file cannot be memory-mapped (empty image list)
+            total = int(self.offsets[-1])
+            self._images = np.memmap(self.path, dtype=np.uint8, mode="r", shape=(total,)) if total \
+                else np.zeros(0, dtype=np.uint8)
+        return self._images
+
+    def __getitem__(self, i):
+        """(image, (h0, w0), (h, w)); the image is a writable copy since augmentations work in place"""
+        h, w = (int(v) for v in self.hw[i])
+        h0, w0 = (int(v) for v in self.orig_hw[i])
+        start = int(self.offsets[i])
+        return np.array(self.images[start:start + h * w * 3]).reshape(h, w, 3), (h0, w0), (h, w)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"] = None
+        return state
+
+
+class CachedYOLODataset(YOLODataset):
+    """YOLODataset that reads rect-mode images from an ImageCache instead of decoding them"""
+
+    image_cache = None
+
+    def load_image(self, i, rect_mode=True):
+        if self.image_cache is None or not rect_mode:
+            return super().load_image(i, rect_mode)
+        # Mosaic/MixUp draw their extra images from the buffer of recently loaded indices
+        if self.augment:
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return self.image_cache[i]
+
+
+def attach_image_cache(dataset, cache):
+    """Switch a built YOLODataset to read from an ImageCache (module-level class, so it still pickles)"""
+    dataset.__class__ = CachedYOLODataset
+    dataset.image_cache = cache
+    return dataset
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer whose train and val datasets read decoded images from an ImageCache"""
+
+    cache_dir = CACHE_DIR
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        dataset = super().build_dataset(img_path, mode, batch)
+        cache = ImageCache.for_files(dataset.im_files, dataset.imgsz, self.cache_dir)
+        return attach_image_cache(dataset, cache.load_or_build(self.args.workers or None))
@@ -3,28 +3,34 @@ from pathlib import Path
 import cv2
 import os
 import yaml
+from evaluate import evaluate
+from renderer import Renderer
 
 
 # Function to predict and save images
-def predict_and_save(model, image_path, output_path, output_path_txt):
+def predict_and_save(model, image_path, output_path, output_path_txt, renderer):
     # Perform prediction
     results = model.predict(image_path,conf=0.5)
 
     result = results[0]
-    # Draw boxes on the image
-    img = result.plot()  # Plots the predictions directly on the image
+    # Draw boxes on the image with the shared renderer (same look as the video and real-time scripts)
+    boxes = result.boxes
+    img = renderer.draw(result.orig_img, boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                        boxes.cls.cpu().numpy().astype(int))
 
     # Save the result
     cv2.imwrite(str(output_path), img)
     # Save the bounding box data
     with open(output_path_txt, 'w') as f:
         for box in result.boxes:
-            # Extract the class id and bounding box coordinates
+            # Extract the class id, normalized bounding box coordinates and confidence
             cls_id = int(box.cls)
-            x_center, y_center, width, height = box.xywh[0].tolist()
+            x_center, y_center, width, height = box.xywhn[0].tolist()
+            conf = float(box.conf)
             
-            # Write bbox information in the format [class_id, x_center, y_center, width, height]
-            f.write(f"{cls_id} {x_center} {y_center} {width} {height}\n")
+            # Write bbox information in the format [class_id, x_center, y_center, width, height, conf]
+            # (YOLO label format plus confidence, so evaluate.py can score it without re-running the model)
+            f.write(f"{cls_id} {x_center} {y_center} {width} {height} {conf}\n")
 
 
 if __name__ == '__main__': 
@@ -74,6 +80,7 @@ if __name__ == '__main__':
 
     # model_path = detect_path / train_folders[idx] / "weights" / "best.pt"
     model = YOLO(r"C:\Users\Ankur Rawat\Downloads\Duality_AI_Task\Duality_ai\runs\detect\train5\weights\best.pt")
+    renderer = Renderer(list(model.names.values()))
 
     # Directory with images
     output_dir = this_dir / "predictions" # Replace with the directory where you want to save predictions
@@ -91,10 +98,12 @@ if __name__ == '__main__':
             continue
         output_path_img = images_output_dir / img_path.name  # Save image in 'images' folder
         output_path_txt = labels_output_dir / img_path.with_suffix('.txt').name  # Save label in 'labels' folder
-        predict_and_save(model, img_path, output_path_img, output_path_txt)
+        predict_and_save(model, img_path, output_path_img, output_path_txt, renderer)
 
     print(f"Predicted images saved in {images_output_dir}")
     print(f"Bounding box labels saved in {labels_output_dir}")
     data = this_dir / 'yolo_params.yaml'
     print(f"Model parameters saved in {data}")
-    metrics = model.val(data=data, split="test")
+    # Score the saved label files directly instead of running inference over the test set again
+    # (mAP only covers predictions above the conf=0.5 used above)
+    metrics = evaluate(labels_output_dir, data, split="test")
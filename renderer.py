@@ -0,0 +1,134 @@
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class Renderer:
+    """
+    Shared detection renderer for the real-time scripts, video detection and the backend.
+
+    The per-box cost of the old drawing loops was dominated by text handling: every frame
+    re-measured each label with cv2.getTextSize and rasterized it with cv2.putText. Here the
+    colour, thickness and a pre-rendered label sprite (background + text) are built once per
+    (class, confidence bucket) and then simply copied into the frame. Frames are drawn in place,
+    or into one reusable output buffer when the caller must keep the original untouched.
+    """
+
+    def __init__(self, class_names, colors=None, style_fn=None, thickness=2, font_scale=0.6,
+                 font_thickness=2, text_color=(0, 0, 0), label_fmt='{name} {conf:.2f}',
+                 conf_step=0.01, boxes_only=False):
+        """
+        Args:
+            class_names (list): Class names indexed by class id
+            colors (dict|list): BGR colour per class id (or per class name); defaults to green
+            style_fn (callable): Optional (cls, conf) -> (color, thickness), overrides colors/thickness
+            thickness (int): Box line thickness
+            font_scale (float): Label font scale
+            font_thickness (int): Label font thickness
+            text_color (tuple): BGR colour of the label text
+            label_fmt (str): Label format, receives `name` and `conf`
+            conf_step (float): Width of a confidence bucket; labels show the bucket's confidence
+            boxes_only (bool): Skip labels entirely (fast mode)
+        """
+        self.class_names = list(class_names)
+        self.colors = colors or {}
+        self.style_fn = style_fn
+        self.thickness = thickness
+        self.font_scale = font_scale
+        self.font_thickness = font_thickness
+        self.text_color = text_color
+        self.label_fmt = label_fmt
+        self.conf_step = conf_step
+        self.boxes_only = boxes_only
+        self._styles = {}
+        self._sprites = {}
+        self._text_sizes = {}
+        self._buffer = None
+
+    def name(self, cls):
+        return self.class_names[cls] if 0 <= cls < len(self.class_names) else str(cls)
+
+    def text_size(self, text, font_scale=None, font_thickness=None):
+        """Cached cv2.getTextSize: ((width, height), baseline)"""
+        key = (text, font_scale or self.font_scale, font_thickness or self.font_thickness)
+        size = self._text_sizes.get(key)
+        if size is None:
+            size = self._text_sizes[key] = cv2.getTextSize(text, FONT, key[1], key[2])
+        return size
+
+    def _style(self, cls, bucket):
+        key = (cls, bucket)
+        style = self._styles.get(key)
+        if style is None:
+            if self.style_fn is not None:
+                style = self.style_fn(cls, bucket * self.conf_step)
+            else:
+                colors = self.colors
+                if isinstance(colors, dict):
+                    color = colors.get(cls, colors.get(self.name(cls), (0, 255, 0)))
+                else:
+                    color = colors[cls] if 0 <= cls < len(colors) else (0, 255, 0)
+                style = (color, self.thickness)
+            self._styles[key] = style
+        return style
+
+    def _sprite(self, cls, bucket, color):
+        key = (cls, bucket)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            label = self.label_fmt.format(name=self.name(cls), conf=bucket * self.conf_step)
+            (w, h), _ = self.text_size(label)
+            sprite = np.empty((h + 10, w, 3), dtype=np.uint8)
+            sprite[:] = color
+            cv2.putText(sprite, label, (0, h + 5), FONT, self.font_scale, self.text_color, self.font_thickness)
+            self._sprites[key] = sprite
+        return sprite
+
+    def buffer_for(self, frame):
+        """Copy a frame into the renderer's reusable buffer (reallocated only if the shape changes)"""
+        if self._buffer is None or self._buffer.shape != frame.shape:
+            self._buffer = np.empty_like(frame)
+        np.copyto(self._buffer, frame)
+        return self._buffer
+
+    def draw(self, frame, boxes, confs, clss, copy=False, boxes_only=None):
+        """
+        Draw detections
+
+        Args:
+            frame (numpy.ndarray): BGR frame
+            boxes (array-like): xyxy boxes, shape (N, 4)
+            confs (array-like): Confidences, shape (N,)
+            clss (array-like): Class ids, shape (N,)
+            copy (bool): Draw into the reusable buffer instead of `frame`
+            boxes_only (bool): Override the renderer's boxes-only mode for this call
+
+        Returns:
+            numpy.ndarray: The annotated frame (`frame` itself unless copy=True)
+        """
+        if copy:
+            frame = self.buffer_for(frame)
+        boxes_only = self.boxes_only if boxes_only is None else boxes_only
+        if len(boxes) == 0:
+            return frame
+
+        boxes = np.asarray(boxes).astype(np.int32)
+        buckets = np.rint(np.asarray(confs, dtype=np.float64) / self.conf_step).astype(np.int64)
+        clss = np.asarray(clss).astype(np.int64)
+        fh, fw = frame.shape[:2]
+        for (x1, y1, x2, y2), cls, bucket in zip(boxes.tolist(), clss.tolist(), buckets.tolist()):
+            color, thickness = self._style(cls, bucket)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, thickness)
+            if boxes_only:
+                continue
+
+            # Label sits on top of the box, clipped to the frame
+            sprite = self._sprite(cls, bucket, color)
+            sh, sw = sprite.shape[:2]
+            top, left = y1 - sh, x1
+            fy1, fx1 = max(top, 0), max(left, 0)
+            fy2, fx2 = min(top + sh, fh), min(left + sw, fw)
+            if fy2 > fy1 and fx2 > fx1:
+                frame[fy1:fy2, fx1:fx2] = sprite[fy1 - top:fy2 - top, fx1 - left:fx2 - left]
+        return frame
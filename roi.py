@@ -0,0 +1,210 @@
+import math
+import os
+
+import cv2
+import numpy as np
+import yaml
+
+# Per-camera ROI polygons live here by default (see roi_config.yaml for the format)
+ROI_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "roi_config.yaml")
+
+# Letterbox grey used by YOLO, so masked-out pixels look like padding to the model
+PAD_VALUE = 114
+
+# Model stride; inference sizes are multiples of it
+STRIDE = 32
+
+
+def load_roi_polygons(camera, config_path=ROI_CONFIG_PATH):
+    """
+    Load the ROI polygons configured for a camera
+
+    Args:
+        camera (str|int): Camera key in the config (webcam index, URL or any name)
+        config_path (str): Path to the ROI YAML config
+
+    Returns:
+        list: Polygons as lists of [x, y] points, or None if the camera has no ROIs
+    """
+    if not config_path or not os.path.exists(config_path):
+        return None
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f) or {}
+    cameras = config.get("cameras") or {}
+    polygons = cameras.get(str(camera), cameras.get("default"))
+    return polygons or None
+
+
+def packed_shape(shapes, scale, stride=STRIDE):
+    """
+    Shared inference size of a batch of crops resized by `scale`
+
+    Returns:
+        tuple: ((h, w) stride-aligned size of the batch, [(h, w)] resized size of every crop)
+    """
+    sizes = [(max(1, int(round(h * scale))), max(1, int(round(w * scale)))) for h, w in shapes]
+    h = int(math.ceil(max(s[0] for s in sizes) / stride)) * stride
+    w = int(math.ceil(max(s[1] for s in sizes) / stride)) * stride
+    return (h, w), sizes
+
+
+def pack_crops(crops, scale, stride=STRIDE):
+    """
+    Resize crops by `scale` and pad them (bottom/right) to one shared stride-aligned rectangle
+
+    A batch of differently shaped images is letterboxed by ultralytics into imgsz x imgsz
+    squares. Equally shaped images passed with imgsz=(h, w) are inferred as they are, so the
+    compute follows the crops' area instead of the square's.
+
+    Returns:
+        tuple: (padded crops, (h, w) to pass as imgsz, [(gain_x, gain_y)] per crop to map boxes back)
+    """
+    (h, w), sizes = packed_shape([c.shape[:2] for c in crops], scale, stride)
+    batch, gains = [], []
+    for crop, (ch, cw) in zip(crops, sizes):
+        gains.append((cw / crop.shape[1], ch / crop.shape[0]))
+        if (ch, cw) != crop.shape[:2]:
+            crop = cv2.resize(crop, (cw, ch), interpolation=cv2.INTER_LINEAR)
+        canvas = np.full((h, w) + crop.shape[2:], PAD_VALUE, dtype=crop.dtype)
+        canvas[:ch, :cw] = crop
+        batch.append(canvas)
+    return batch, (h, w), gains
+
+
+class RoiMasker:
+    """
+    Restricts inference to the union of configured ROI polygons.
+
+    Each polygon's bounding rectangle is cropped from the frame and pixels outside the
+    polygons are filled with the letterbox grey. Overlapping rectangles are merged so no
+    pixel is inferred twice; disjoint ones are sent to the model as one batch, padded to a
+    shared stride-aligned rectangle (see pack_crops). Crops are resized to the pixel scale of a
+    full-frame run, which makes compute roughly proportional to the ROI area instead of the
+    frame area; inference_fraction reports the actual ratio.
+    """
+
+    def __init__(self, polygons, pad=8):
+        """
+        Args:
+            polygons (list): Polygons as lists of [x, y] points, either normalized (0-1) or in pixels
+            pad (int): Pixels added around each polygon's bounding rectangle
+        """
+        self.polygons = [np.asarray(p, dtype=np.float32).reshape(-1, 2) for p in polygons]
+        # Normalized polygons apply to any resolution; pixel ones only to the source resolution
+        self.normalized = all(p.max() <= 1.0 for p in self.polygons)
+        self.pad = pad
+        self._shape = None
+
+    def _prepare(self, shape):
+        """Rasterize the polygons and compute merged crop rectangles for a frame shape (cached)"""
+        if self._shape == shape:
+            return
+        h, w = shape[:2]
+        self.pixel_polygons = []
+        for poly in self.polygons:
+            pts = poly * np.array([w, h], dtype=np.float32) if poly.max() <= 1.0 else poly
+            self.pixel_polygons.append(np.round(pts).astype(np.int32))
+
+        self.mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(self.mask, self.pixel_polygons, 255)
+
+        rects = []
+        for pts in self.pixel_polygons:
+            x, y, rw, rh = cv2.boundingRect(pts)
+            rects.append([max(x - self.pad, 0), max(y - self.pad, 0),
+                          min(x + rw + self.pad, w), min(y + rh + self.pad, h)])
+        self.rects = self._merge_rects(rects)
+        self.crop_masks = [self.mask[y1:y2, x1:x2] == 0 for x1, y1, x2, y2 in self.rects]
+        self._shape = shape
+
+    @staticmethod
+    def _merge_rects(rects):
+        """Merge overlapping rectangles until all remaining ones are disjoint"""
+        rects = [list(r) for r in rects]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return rects
+
+    def crops(self, frame):
+        """Return the masked ROI crops of a frame, in the same order as self.rects"""
+        self._prepare(frame.shape)
+        crops = []
+        for (x1, y1, x2, y2), outside in zip(self.rects, self.crop_masks):
+            crop = frame[y1:y2, x1:x2].copy()
+            crop[outside] = PAD_VALUE
+            crops.append(crop)
+        return crops
+
+    def detect(self, model, frame, imgsz=640, **kwargs):
+        """
+        Run the model on the ROI crops and map detections back to frame coordinates
+
+        Args:
+            model: Loaded YOLO model
+            frame (numpy.ndarray): Full BGR frame
+            imgsz (int): Inference size a full-frame run would use
+            **kwargs: Extra arguments passed to the model call (conf, iou, device, ...)
+
+        Returns:
+            tuple: (xyxy, conf, cls) numpy arrays in frame coordinates
+        """
+        # Keep the full-frame pixel scale: a crop half the frame size is inferred at half imgsz
+        scale = imgsz / float(max(frame.shape[:2]))
+        batch, batch_imgsz, gains = pack_crops(self.crops(frame), scale)
+
+        results = model(batch, imgsz=batch_imgsz, **kwargs)
+
+        all_boxes, all_confs, all_clss = [], [], []
+        for (x1, y1, _, _), (gx, gy), r in zip(self.rects, gains, results):
+            if r.boxes is None or len(r.boxes) == 0:
+                continue
+            boxes = r.boxes.xyxy.cpu().numpy()
+            boxes[:, [0, 2]] = boxes[:, [0, 2]] / gx + x1
+            boxes[:, [1, 3]] = boxes[:, [1, 3]] / gy + y1
+            all_boxes.append(boxes)
+            all_confs.append(r.boxes.conf.cpu().numpy())
+            all_clss.append(r.boxes.cls.cpu().numpy().astype(int))
+
+        if not all_boxes:
+            return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=int)
+        boxes = np.concatenate(all_boxes)
+        confs = np.concatenate(all_confs)
+        clss = np.concatenate(all_clss)
+
+        # Drop boxes whose centre falls outside the polygons (e.g. in the padded corners of a crop)
+        keep = self.inside(boxes, frame.shape)
+        return boxes[keep], confs[keep], clss[keep]
+
+    def inference_fraction(self, shape, imgsz=640):
+        """Pixels inferred per frame relative to a full-frame run at imgsz (rect letterbox)"""
+        self._prepare(shape)
+        h, w = shape[:2]
+        scale = imgsz / float(max(h, w))
+        (bh, bw), _ = packed_shape([(y2 - y1, x2 - x1) for x1, y1, x2, y2 in self.rects], scale)
+        (fh, fw), _ = packed_shape([(h, w)], scale)
+        return len(self.rects) * bh * bw / float(fh * fw)
+
+    def inside(self, boxes, shape):
+        """Boolean mask of the xyxy boxes whose centre lies inside the polygons"""
+        self._prepare(shape)
+        h, w = shape[:2]
+        cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(int), 0, w - 1)
+        cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype(int), 0, h - 1)
+        return self.mask[cy, cx] > 0
+
+    def draw(self, frame, color=(255, 255, 0)):
+        """Outline the ROI polygons on a frame in place"""
+        self._prepare(frame.shape)
+        cv2.polylines(frame, self.pixel_polygons, True, color, 1)
+        return frame
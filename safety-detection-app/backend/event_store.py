@@ -0,0 +1,334 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Column layout shared by every segment: name -> (dtype, values per row)
+COLUMNS = {
+    'ts': (np.float64, 1),      # Unix timestamp of the request
+    'image': (np.uint64, 1),    # Per-store sequence number of the processed image
+    'source': (np.uint32, 1),   # Index into sources.json (camera name or upload filename)
+    'cls': (np.int16, 1),       # Class id
+    'conf': (np.float32, 1),    # Detection confidence
+    'box': (np.float32, 4),     # x1, y1, x2, y2 in image pixels
+}
+
+# Rows per segment before it is sealed and indexed
+SEGMENT_ROWS = 1 << 16
+
+
+class Segment:
+    """
+    One directory of append-only column files (<name>.bin), read through np.memmap.
+
+    Rows are appended in timestamp order, so the `ts` column doubles as the time index
+    (np.searchsorted). Sealed segments also carry meta.json with the time range and per-class
+    counts, and cls_index.npy: row numbers ordered by class, so the rows of one class are a
+    contiguous, time-ordered slice whose bounds come from the per-class counts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = None
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.meta = json.load(f)
+        self._columns = None
+        self._class_index = None
+
+    @property
+    def sealed(self):
+        return self.meta is not None
+
+    def __len__(self):
+        if self.sealed:
+            return self.meta['rows']
+        ts_path = os.path.join(self.path, 'ts.bin')
+        return os.path.getsize(ts_path) // np.dtype(np.float64).itemsize if os.path.exists(ts_path) else 0
+
+    def columns(self):
+        """Memory-map the columns (cached for sealed segments, re-mapped for the growing one)"""
+        if self._columns is not None:
+            return self._columns
+        rows = len(self)
+        columns = {}
+        for name, (dtype, width) in COLUMNS.items():
+            shape = (rows, width) if width > 1 else (rows,)
+            if rows == 0:
+                columns[name] = np.zeros(shape, dtype=dtype)
+            else:
+                columns[name] = np.memmap(os.path.join(self.path, f'{name}.bin'), dtype=dtype, mode='r', shape=shape)
+        if self.sealed:
+            self._columns = columns
+        return columns
+
+    def class_index(self):
+        if self._class_index is None:
+            self._class_index = np.load(os.path.join(self.path, 'cls_index.npy'), mmap_mode='r')
+        return self._class_index
+
+    def append(self, columns):
+        # `ts` is written last: readers size the segment from it, so every other column is complete
+        for name in sorted(columns, key=lambda name: name == 'ts'):
+            values = columns[name]
+            with open(os.path.join(self.path, f'{name}.bin'), 'ab') as f:
+                f.write(np.ascontiguousarray(values, dtype=COLUMNS[name][0]).tobytes())
+
+    def repair(self):
+        """
+        Truncate every column file to the number of complete `ts` rows
+
+        A crash between column writes leaves the other columns longer than `ts` (and `ts`
+        itself possibly mid-row); without this, later appends would be misaligned with `ts`.
+        """
+        rows = len(self)
+        for name, (dtype, width) in COLUMNS.items():
+            path = os.path.join(self.path, f'{name}.bin')
+            size = rows * width * np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def seal(self, num_classes):
+        """Write the class index and metadata; the segment is read-only afterwards"""
+        columns = self.columns()
+        cls = np.asarray(columns['cls'])
+        order = np.argsort(cls, kind='stable').astype(np.uint32)
+        np.save(os.path.join(self.path, 'cls_index.npy'), order)
+        counts = np.bincount(cls, minlength=num_classes) if len(cls) else np.zeros(num_classes, dtype=int)
+        meta = {
+            'rows': int(len(cls)),
+            'ts_min': float(columns['ts'][0]) if len(cls) else 0.0,
+            'ts_max': float(columns['ts'][-1]) if len(cls) else 0.0,
+            'class_counts': [int(c) for c in counts],
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        self.meta = meta
+
+    def time_bounds(self):
+        if self.sealed:
+            return self.meta['ts_min'], self.meta['ts_max']
+        ts = self.columns()['ts']
+        return (float(ts[0]), float(ts[-1])) if len(ts) else (0.0, 0.0)
+
+    def select(self, start=None, end=None, classes=None):
+        """Row numbers (ascending, i.e. time-ordered) matching a time range and class filter"""
+        ts = self.columns()['ts']
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side='right'))
+        if classes is None:
+            return np.arange(lo, hi)
+        if not self.sealed:
+            rows = np.arange(lo, hi)
+            return rows[np.isin(self.columns()['cls'][lo:hi], classes)]
+
+        # Class rows are contiguous in the class index; each slice is time-ordered, so the
+        # time range is applied per class with searchsorted on the row numbers themselves
+        offsets = np.concatenate([[0], np.cumsum(self.meta['class_counts'])])
+        parts = []
+        for c in classes:
+            if c < 0 or c >= len(self.meta['class_counts']):
+                continue
+            rows = self.class_index()[offsets[c]:offsets[c + 1]]
+            parts.append(rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)])
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+
+class DetectionStore:
+    """
+    Append-only columnar store of detections, partitioned into memory-mapped segments.
+
+    Each /detect call appends one batch of rows to the active segment; once it holds
+    SEGMENT_ROWS rows it is sealed (indexed) and a new one is started. Timestamps are kept
+    non-decreasing so every segment stays sorted by time.
+
+    Image sequence numbers come from the last stored row; images without detections write
+    no rows, so their numbers are persisted in next_image.json instead and never reused.
+    """
+
+    def __init__(self, root, class_names, segment_rows=SEGMENT_ROWS):
+        self.root = root
+        self.class_names = list(class_names)
+        self.segment_rows = segment_rows
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        self.sources_path = os.path.join(root, 'sources.json')
+        self.next_image_path = os.path.join(root, 'next_image.json')
+        self.sources = []
+        if os.path.exists(self.sources_path):
+            with open(self.sources_path, 'r') as f:
+                self.sources = json.load(f)
+        self.source_ids = {name: i for i, name in enumerate(self.sources)}
+
+        names = sorted(d for d in os.listdir(root) if d.startswith('seg_'))
+        self.segments = [Segment(os.path.join(root, d)) for d in names]
+        if not self.segments or self.segments[-1].sealed:
+            self._new_segment()
+        else:
+            self.segments[-1].repair()
+
+        self.last_ts = 0.0
+        self.next_image = 0
+        for segment in reversed(self.segments):
+            columns = segment.columns()
+            if len(columns['ts']):
+                self.last_ts = float(columns['ts'][-1])
+                self.next_image = int(columns['image'][-1]) + 1
+                break
+        if os.path.exists(self.next_image_path):
+            with open(self.next_image_path, 'r') as f:
+                self.next_image = max(self.next_image, int(json.load(f)))
+
+    def _new_segment(self):
+        path = os.path.join(self.root, f'seg_{len(self.segments):06d}')
+        os.makedirs(path, exist_ok=True)
+        self.segments.append(Segment(path))
+
+    def _save_next_image(self):
+        # Write-then-rename, so a crash never leaves a truncated counter behind
+        tmp = self.next_image_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.next_image, f)
+        os.replace(tmp, self.next_image_path)
+
+    def _source_id(self, source):
+        if source not in self.source_ids:
+            self.source_ids[source] = len(self.sources)
+            self.sources.append(source)
+            with open(self.sources_path, 'w') as f:
+                json.dump(self.sources, f)
+        return self.source_ids[source]
+
+    def append(self, source, clss, confs, boxes, ts=None):
+        """
+        Append the detections of one processed image
+
+        Args:
+            source (str): Camera name or upload filename
+            clss (array-like): Class ids, shape (N,)
+            confs (array-like): Confidences, shape (N,)
+            boxes (array-like): xyxy boxes, shape (N, 4)
+            ts (float): Timestamp, defaults to now
+
+        Returns:
+            int: Image sequence number assigned to this batch
+        """
+        with self.lock:
+            ts = max(time.time() if ts is None else float(ts), self.last_ts)
+            image = self.next_image
+            self.next_image += 1
+            n = len(clss)
+            if n == 0:
+                # No row carries this number, so it would be handed out again after a restart
+                self._save_next_image()
+                return image
+            self.segments[-1].append({
+                'ts': np.full(n, ts),
+                'image': np.full(n, image),
+                'source': np.full(n, self._source_id(source)),
+                'cls': np.asarray(clss),
+                'conf': np.asarray(confs),
+                'box': np.asarray(boxes).reshape(n, 4),
+            })
+            self.last_ts = ts
+            if len(self.segments[-1]) >= self.segment_rows:
+                self.segments[-1].seal(len(self.class_names))
+                self._new_segment()
+            return image
+
+    def query(self, start=None, end=None, classes=None, source=None, offset=0, limit=100, bucket=None):
+        """
+        Newest-first page of detections plus aggregates over everything that matches
+
+        Args:
+            start (float): Inclusive lower bound on the timestamp
+            end (float): Inclusive upper bound on the timestamp
+            classes (list): Class names to keep (None for all)
+            source (str): Only keep detections from this source
+            offset (int): Number of matching rows to skip (newest first)
+            limit (int): Maximum rows to return
+            bucket (float): If set, also return detection counts per `bucket` seconds
+
+        Returns:
+            dict: total, offset, limit, detections and aggregates
+        """
+        class_ids = None
+        if classes:
+            class_ids = [self.class_names.index(c) for c in classes if c in self.class_names]
+        source_id = None
+        if source is not None:
+            source_id = self.source_ids.get(source, -1)
+
+        with self.lock:
+            segments = list(self.segments)
+
+        matches = []
+        for segment in segments:
+            if len(segment) == 0:
+                continue
+            ts_min, ts_max = segment.time_bounds()
+            if (start is not None and ts_max < start) or (end is not None and ts_min > end):
+                continue
+            if segment.sealed and class_ids is not None and not any(
+                    segment.meta['class_counts'][c] for c in class_ids if c < len(segment.meta['class_counts'])):
+                continue
+            columns = segment.columns()
+            rows = segment.select(start, end, class_ids)
+            if source_id is not None:
+                rows = rows[columns['source'][rows] == source_id]
+            if len(rows):
+                matches.append((columns, rows))
+
+        total = sum(len(rows) for _, rows in matches)
+        counts = np.zeros(len(self.class_names), dtype=np.int64)
+        conf_sums = np.zeros(len(self.class_names), dtype=np.float64)
+        timeline = {}
+        for columns, rows in matches:
+            cls = np.asarray(columns['cls'][rows])
+            valid = (cls >= 0) & (cls < len(self.class_names))
+            counts += np.bincount(cls[valid], minlength=len(self.class_names))
+            conf_sums += np.bincount(cls[valid], weights=columns['conf'][rows][valid], minlength=len(self.class_names))
+            if bucket:
+                keys, key_counts = np.unique(np.floor(columns['ts'][rows] / bucket) * bucket, return_counts=True)
+                for k, c in zip(keys, key_counts):
+                    timeline[float(k)] = timeline.get(float(k), 0) + int(c)
+
+        # Walk segments newest first and only materialize the requested page
+        page = []
+        skip = offset
+        for columns, rows in reversed(matches):
+            if len(page) >= limit:
+                break
+            rows = rows[::-1]
+            if skip >= len(rows):
+                skip -= len(rows)
+                continue
+            rows = rows[skip:skip + limit - len(page)]
+            skip = 0
+            for ts, image, src, cls, conf, box in zip(columns['ts'][rows], columns['image'][rows],
+                                                      columns['source'][rows], columns['cls'][rows],
+                                                      columns['conf'][rows], columns['box'][rows]):
+                page.append({
+                    'ts': float(ts),
+                    'image': int(image),
+                    'source': self.sources[src] if src < len(self.sources) else str(src),
+                    'class': self.class_names[cls] if 0 <= cls < len(self.class_names) else str(cls),
+                    'conf': float(conf),
+                    'box': [float(x) for x in box],
+                })
+
+        aggregates = {
+            'class_counts': {name: int(c) for name, c in zip(self.class_names, counts)},
+            'mean_conf': {name: (float(s / c) if c else None)
+                          for name, s, c in zip(self.class_names, conf_sums, counts)},
+        }
+        if bucket:
+            aggregates['timeline'] = [{'start': k, 'count': timeline[k]} for k in sorted(timeline)]
+        return {'total': int(total), 'offset': offset, 'limit': limit, 'detections': page, 'aggregates': aggregates}
@@ -0,0 +1,239 @@
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+
+import numpy as np
+
+from inference_worker import HANDSHAKE_TIMEOUT, connect_handshake, parse_address, recv_message, send_message
+
+# Errors that mean "this worker could not serve the request", as opposed to a bad request.
+# ValueError covers malformed replies (bad header, oversized message).
+TRANSPORT_ERRORS = (OSError, EOFError, TimeoutError, AuthenticationError, ValueError)
+
+
+class WorkerUnavailable(Exception):
+    """No healthy worker could serve the request"""
+
+
+class WorkerError(Exception):
+    """A worker received the request but failed to process it"""
+
+
+class WorkerHandle:
+    """Connections, load and metrics of one registered inference worker"""
+
+    def __init__(self, address, static=False):
+        self.address = address
+        self.static = static            # configured through INFERENCE_WORKERS, never expired
+        self.healthy = True             # optimistic until a request or health check fails
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latencies = deque(maxlen=1000)
+        self.last_seen = time.time()
+        self.info = {}
+        self.idle = []                  # open connections ready for reuse
+        self.lock = threading.Lock()
+
+    def call(self, request, timeout):
+        """
+        Send one request over a pooled connection and wait up to `timeout` seconds for the reply
+
+        New connections (connect plus handshake) get at most min(timeout, HANDSHAKE_TIMEOUT)
+        seconds, so an address that drops packets fails fast instead of after the OS TCP timeout.
+        """
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            connect_timeout = min(timeout, HANDSHAKE_TIMEOUT)
+            conn = socket.create_connection(parse_address(self.address), timeout=connect_timeout)
+            try:
+                connect_handshake(conn)
+            except BaseException:
+                conn.close()
+                raise
+        try:
+            conn.settimeout(timeout)
+            send_message(conn, request)
+            response = recv_message(conn)
+        except BaseException:
+            # The connection may still carry a late reply; never reuse it
+            conn.close()
+            raise
+        with self.lock:
+            self.idle.append(conn)
+        return response
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+    def mark_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.healthy = False
+        self.close()
+
+    def mark_alive(self):
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.last_seen = time.time()
+
+    def metrics(self):
+        latency = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'address': self.address,
+            'healthy': self.healthy,
+            'static': self.static,
+            'inflight': self.inflight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'latency_ms_mean': float(latency.mean()),
+            'latency_ms_p95': float(np.percentile(latency, 95)),
+            'last_seen': self.last_seen,
+            'worker': self.info,
+        }
+
+
+class WorkerPool:
+    """
+    Routes inference to registered workers.
+
+    Each request goes to the healthy worker with the fewest requests in flight from this
+    gateway (ties broken by recent latency). If a worker cannot be reached or times out it is
+    marked unhealthy and the request is retried on another worker, up to `retries` times. A
+    background thread pings every worker each `health_interval` seconds, bringing recovered
+    workers back and dropping dynamically registered ones not seen for `expire` seconds.
+    """
+
+    def __init__(self, addresses=(), timeout=30.0, retries=2, health_interval=5.0, health_timeout=2.0, expire=60.0):
+        """
+        Args:
+            addresses (list): 'host:port' of workers that are always part of the pool
+            timeout (float): Seconds to wait for a detection reply
+            retries (int): Extra attempts on other workers after a transport failure
+            health_interval (float): Seconds between health checks
+            health_timeout (float): Seconds to wait for a ping reply
+            expire (float): Drop registered (non-static) workers not seen for this long
+        """
+        self.workers = {a: WorkerHandle(a, static=True) for a in addresses}
+        self.timeout = timeout
+        self.retries = retries
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.expire = expire
+        self.retried = 0
+        self.unavailable = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def register(self, address):
+        """Add a worker, or refresh its heartbeat if it is already known"""
+        parse_address(address)
+        with self.lock:
+            worker = self.workers.get(address)
+            if worker is None:
+                worker = self.workers[address] = WorkerHandle(address)
+                print(f"Worker registered: {address}")
+        worker.last_seen = time.time()
+        return worker
+
+    def _pick(self, exclude):
+        with self.lock:
+            candidates = [w for a, w in self.workers.items() if w.healthy and a not in exclude]
+            if not candidates:
+                return None
+            worker = min(candidates, key=lambda w: (w.inflight, np.mean(w.latencies) if w.latencies else 0.0))
+            worker.inflight += 1
+            return worker
+
+    def infer(self, image, camera=None):
+        """
+        Run detection on a worker (blocking; call from a thread pool)
+
+        Returns:
+            tuple: (xyxy, conf, cls) numpy arrays in image coordinates
+        """
+        request = {'op': 'detect', 'image': image, 'camera': camera}
+        tried = set()
+        for attempt in range(self.retries + 1):
+            worker = self._pick(tried)
+            if worker is None:
+                break
+            tried.add(worker.address)
+            if attempt:
+                self.retried += 1
+            start = time.perf_counter()
+            try:
+                response = worker.call(request, self.timeout)
+            except TRANSPORT_ERRORS as e:
+                print(f"Worker {worker.address} failed ({type(e).__name__}: {e}), marking unhealthy")
+                worker.mark_failure()
+                continue
+            finally:
+                with self.lock:
+                    worker.inflight -= 1
+            worker.requests += 1
+            worker.latencies.append((time.perf_counter() - start) * 1000)
+            worker.mark_alive()
+            if not response.get('ok'):
+                raise WorkerError(f"{worker.address}: {response.get('error')}")
+            return response['boxes'], response['confs'], response['clss']
+        self.unavailable += 1
+        raise WorkerUnavailable(f'No healthy inference worker available (tried {len(tried)})')
+
+    def _check(self, address, worker, now):
+        try:
+            worker.info = worker.call({'op': 'ping'}, self.health_timeout)
+        except TRANSPORT_ERRORS:
+            if worker.healthy:
+                print(f"Worker {address} failed its health check")
+            worker.mark_failure()
+            if not worker.static and now - worker.last_seen > self.expire:
+                with self.lock:
+                    self.workers.pop(address, None)
+                print(f"Worker {address} expired")
+            return
+        if not worker.healthy:
+            print(f"Worker {address} is healthy again")
+        worker.mark_alive()
+
+    def check_health(self):
+        """Ping all workers concurrently; expire registered workers that stay unreachable"""
+        now = time.time()
+        with self.lock:
+            workers = list(self.workers.items())
+        if not workers:
+            return
+        # One unreachable worker costs at most health_timeout, not health_timeout per worker
+        with ThreadPoolExecutor(max_workers=min(len(workers), 32)) as executor:
+            for address, worker in workers:
+                executor.submit(self._check, address, worker, now)
+
+    def _health_loop(self):
+        while True:
+            self.check_health()
+            time.sleep(self.health_interval)
+
+    def start(self):
+        """Start the background health checks"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def metrics(self):
+        with self.lock:
+            workers = list(self.workers.values())
+        return {
+            'workers': [w.metrics() for w in workers],
+            'healthy': sum(w.healthy for w in workers),
+            'retried': self.retried,
+            'unavailable': self.unavailable,
+        }
@@ -0,0 +1,289 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import urllib.request
+from multiprocessing import AuthenticationError
+
+import numpy as np
+
+# Shared helpers (roi.py, ...) live in the project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+from roi import RoiMasker, load_roi_polygons, ROI_CONFIG_PATH
+
+MODEL_PATH = os.path.join(PROJECT_ROOT, 'runs', 'detect', 'train5', 'weights', 'best.pt')
+
+# Shared secret for the gateway <-> worker connections and worker registration; there is no
+# default, workers and the gateway refuse to start without it
+RPC_AUTHKEY = os.environ.get('RPC_AUTHKEY', '').encode()
+
+# A connection must finish the HMAC handshake within this many seconds
+HANDSHAKE_TIMEOUT = 5.0
+
+# Upper bound for one message (JSON header plus array bytes), so a peer cannot make us allocate arbitrarily
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+
+# How often a worker re-announces itself to the gateway, so a restarted gateway finds it again
+REGISTER_INTERVAL = 10.0
+
+# ROI polygons per camera; override the config location with the ROI_CONFIG env var
+ROI_CONFIG = os.environ.get('ROI_CONFIG', ROI_CONFIG_PATH)
+roi_maskers = {}
+
+
+def get_roi_masker(camera):
+    """Return the cached RoiMasker for a camera, or None to run on the full image"""
+    if camera not in roi_maskers:
+        polygons = load_roi_polygons(camera, ROI_CONFIG) if camera is not None else None
+        roi_maskers[camera] = RoiMasker(polygons) if polygons else None
+    return roi_maskers[camera]
+
+
+def run_model(model, image, masker=None):
+    """
+    Run the detector on a decoded image, on the camera's ROI crops if it has any
+
+    Returns:
+        tuple: (xyxy, conf, cls) numpy arrays in image coordinates
+    """
+    if masker:
+        # Only the camera's ROI crops are inferred; boxes are mapped back to image coordinates
+        return masker.detect(model, image)
+    r = model(image)[0]
+    return r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(), r.boxes.cls.cpu().numpy().astype(int)
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)"""
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def require_authkey():
+    if not RPC_AUTHKEY:
+        raise RuntimeError('RPC_AUTHKEY is not set; give the gateway and every worker the same private key')
+
+
+def register_token(address):
+    """Proof for /workers/register that the caller holds RPC_AUTHKEY"""
+    return hmac.new(RPC_AUTHKEY, f'register:{address}'.encode(), hashlib.sha256).hexdigest()
+
+
+def recv_exact(sock, n):
+    """Read exactly n bytes (a bytearray, so arrays decoded from it are writable)"""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while view:
+        read = sock.recv_into(view)
+        if not read:
+            raise EOFError('Connection closed by peer')
+        view = view[read:]
+    return buf
+
+
+def _digest(role, nonce):
+    return hmac.new(RPC_AUTHKEY, role + nonce, hashlib.sha256).digest()
+
+
+def accept_handshake(sock):
+    """Worker side of the mutual HMAC challenge; raises AuthenticationError on a wrong key"""
+    nonce = os.urandom(32)
+    sock.sendall(nonce)
+    reply = recv_exact(sock, 64)
+    if not hmac.compare_digest(reply[:32], _digest(b'gateway', nonce)):
+        raise AuthenticationError('Peer does not know RPC_AUTHKEY')
+    sock.sendall(_digest(b'worker', reply[32:]))
+
+
+def connect_handshake(sock):
+    """Gateway side of the mutual HMAC challenge; also checks that the worker knows the key"""
+    nonce = os.urandom(32)
+    sock.sendall(_digest(b'gateway', recv_exact(sock, 32)) + nonce)
+    if not hmac.compare_digest(recv_exact(sock, 32), _digest(b'worker', nonce)):
+        raise AuthenticationError('Worker does not know RPC_AUTHKEY')
+
+
+def send_message(sock, message):
+    """
+    Send a dict as a length-prefixed JSON header followed by the raw bytes of its ndarray values
+
+    Nothing is pickled, so a peer can at worst send wrong data, never code.
+    """
+    header = {k: v for k, v in message.items() if not isinstance(v, np.ndarray)}
+    arrays = [(k, np.ascontiguousarray(v)) for k, v in message.items() if isinstance(v, np.ndarray)]
+    header['arrays'] = [(k, a.dtype.str, a.shape) for k, a in arrays]
+    data = json.dumps(header).encode()
+    sock.sendall(struct.pack('!I', len(data)) + data)
+    for _, array in arrays:
+        sock.sendall(array.tobytes())
+
+
+def recv_message(sock):
+    """Inverse of send_message"""
+    size, = struct.unpack('!I', recv_exact(sock, 4))
+    if size > MAX_MESSAGE_BYTES:
+        raise ValueError(f'Message header of {size} bytes is too large')
+    header = json.loads(recv_exact(sock, size))
+    message = {k: v for k, v in header.items() if k != 'arrays'}
+    total = 0
+    for key, dtype, shape in header.get('arrays', []):
+        dtype = np.dtype(dtype)
+        if dtype.hasobject:
+            raise ValueError('Object arrays are not accepted')
+        nbytes = dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        total += nbytes
+        if total > MAX_MESSAGE_BYTES:
+            raise ValueError(f'Message of more than {MAX_MESSAGE_BYTES} bytes')
+        message[key] = np.frombuffer(recv_exact(sock, nbytes), dtype=dtype).reshape(shape)
+    return message
+
+
+class InferenceWorker:
+    """
+    Holds one model and serves detection requests from the gateway.
+
+    The RPC is plain TCP: every connection starts with a mutual HMAC challenge on RPC_AUTHKEY,
+    then carries send_message/recv_message dicts (JSON plus raw array bytes). Every gateway
+    connection gets its own thread, which also runs the handshake, so a silent peer cannot
+    hold up other connections; inference itself is serialized by a lock, so requests beyond
+    the first queue up and show in the reported in-flight count.
+
+    Requests:
+        {'op': 'detect', 'image': ndarray, 'camera': str|None} -> {'ok', 'boxes', 'confs', 'clss', 'infer_ms'}
+        {'op': 'ping'} -> {'ok', 'inflight', 'served', 'errors', 'infer_ms', ...}
+    """
+
+    def __init__(self, model, address, name=None, device=None):
+        self.model = model
+        self.address = address
+        self.name = name or f'{address[0]}:{address[1]}'
+        self.device = device
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.inflight = 0
+        self.served = 0
+        self.errors = 0
+        self.infer_ms = 0.0  # EMA of model time
+        self.started = time.time()
+
+    def detect(self, image, camera):
+        start = time.perf_counter()
+        with self.lock:
+            boxes, confs, clss = run_model(self.model, image, get_roi_masker(camera))
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.stats_lock:
+            self.infer_ms = elapsed if not self.served else 0.9 * self.infer_ms + 0.1 * elapsed
+        return {'ok': True, 'boxes': boxes, 'confs': confs, 'clss': clss, 'infer_ms': elapsed}
+
+    def status(self):
+        return {'ok': True, 'name': self.name, 'inflight': self.inflight, 'served': self.served,
+                'errors': self.errors, 'infer_ms': self.infer_ms, 'uptime': time.time() - self.started,
+                'device': self.device}
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return self.status()
+        if op != 'detect':
+            return {'ok': False, 'error': f'Unknown op {op!r}'}
+        with self.stats_lock:
+            self.inflight += 1
+        try:
+            response = self.detect(request['image'], request.get('camera'))
+            with self.stats_lock:
+                self.served += 1
+            return response
+        except Exception as e:
+            with self.stats_lock:
+                self.errors += 1
+            return {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        finally:
+            with self.stats_lock:
+                self.inflight -= 1
+
+    def serve_connection(self, conn, peer):
+        try:
+            conn.settimeout(HANDSHAKE_TIMEOUT)
+            try:
+                accept_handshake(conn)
+            except (AuthenticationError, EOFError, OSError) as e:
+                # Wrong key, port scanners, peers that never answer
+                print(f"Rejected connection from {peer[0]}:{peer[1]}: {e}")
+                return
+            # Authenticated connections are pooled by the gateway and may stay idle
+            conn.settimeout(None)
+            while True:
+                request = recv_message(conn)
+                send_message(conn, self.handle(request))
+        except (EOFError, OSError):
+            # Gateway closed the connection (or gave up on a request after its timeout)
+            pass
+        except ValueError as e:
+            print(f"Dropped connection from {peer[0]}:{peer[1]}: {e}")
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        with socket.create_server(self.address) as server:
+            print(f"Inference worker {self.name} listening on {self.address[0]}:{self.address[1]}")
+            while True:
+                try:
+                    conn, peer = server.accept()
+                except OSError as e:
+                    print(f"Accept failed: {e}")
+                    continue
+                threading.Thread(target=self.serve_connection, args=(conn, peer), daemon=True).start()
+
+
+def register_loop(gateway, advertise):
+    """Announce this worker to the gateway every REGISTER_INTERVAL seconds"""
+    url = f"{gateway.rstrip('/')}/workers/register?address={advertise}"
+    request = urllib.request.Request(url, method='POST', headers={'X-Worker-Token': register_token(advertise)})
+    registered = None
+    while True:
+        try:
+            with urllib.request.urlopen(request, timeout=5) as r:
+                json.load(r)
+            if registered is not True:
+                print(f"Registered with gateway {gateway} as {advertise}")
+            registered = True
+        except Exception as e:
+            if registered is not False:
+                print(f"Could not register with gateway {gateway}: {e} (retrying every {REGISTER_INTERVAL:.0f}s)")
+            registered = False
+        time.sleep(REGISTER_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference worker for the backend's gateway mode")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to listen on (0.0.0.0 for other nodes)')
+    parser.add_argument('--port', type=int, default=9101, help='RPC port (default: 9101)')
+    parser.add_argument('--model', type=str, default=MODEL_PATH, help='Model weights')
+    parser.add_argument('--device', type=str, default=None, help='Device, e.g. 0 or cpu (default: auto)')
+    parser.add_argument('--gateway', type=str, default=None, help='Gateway URL to register with, e.g. http://localhost:8000')
+    parser.add_argument('--advertise', type=str, default=None, help='Address the gateway should use (default: host:port)')
+    args = parser.parse_args()
+    if not RPC_AUTHKEY:
+        parser.error('set the RPC_AUTHKEY environment variable (the same private key as the gateway)')
+
+    from ultralytics import YOLO
+    model = YOLO(args.model)
+    if args.device is not None:
+        model.to(args.device)
+
+    worker = InferenceWorker(model, (args.host, args.port), device=args.device)
+    if args.gateway:
+        advertise = args.advertise or f'{args.host}:{args.port}'
+        threading.Thread(target=register_loop, args=(args.gateway, advertise), daemon=True).start()
+    worker.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
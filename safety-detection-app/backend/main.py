@@ -1,11 +1,18 @@
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, UploadFile, Query, HTTPException, Header
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from ultralytics import YOLO
+from PIL import Image
 import cv2
 import numpy as np
 import base64
+import hmac
+import io
 import os
+import sys
+from upload_limit import LimitUploadSize, UploadTooLarge
 
 app = FastAPI()
 
@@ -18,6 +25,60 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Upload limits: bodies are read in chunks and rejected as soon as they exceed MAX_UPLOAD_BYTES
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_MB', 25)) * 1024 * 1024
+UPLOAD_CHUNK = 1024 * 1024
+
+# Model input size; larger uploads are decoded at a reduced scale that still covers it
+INFER_SIZE = 640
+REDUCED_DECODE = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# Multipart framing adds a little on top of the file itself
+app.add_middleware(LimitUploadSize, max_bytes=MAX_UPLOAD_BYTES, overhead=UPLOAD_CHUNK)
+
+async def read_upload(file):
+    """Read the (already size-capped) upload in chunks, enforcing MAX_UPLOAD_BYTES on the file itself"""
+    contents = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK)
+        if not chunk:
+            return contents
+        contents += chunk
+        if len(contents) > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(MAX_UPLOAD_BYTES)
+
+def decode_image(contents, allow_reduced=True):
+    """
+    Decode an upload, at 1/2, 1/4 or 1/8 scale when the image is much larger than INFER_SIZE
+
+    JPEGs are then decoded directly at the reduced scale (DCT scaling), so a 24 MP photo never
+    materializes at full resolution. The original size is read from the header only.
+
+    Returns:
+        tuple: (image, (original_width, original_height))
+    """
+    nparr = np.frombuffer(contents, np.uint8)
+    try:
+        with Image.open(io.BytesIO(contents)) as header:
+            width, height = header.size
+    except Exception:
+        width = height = None
+    flag = cv2.IMREAD_COLOR
+    if allow_reduced and width:
+        for factor, reduced_flag in REDUCED_DECODE:
+            if max(width, height) // factor >= INFER_SIZE:
+                flag = reduced_flag
+                break
+    image = cv2.imdecode(nparr, flag)
+    if image is None:
+        return None, None
+    if width is None:
+        width, height = image.shape[1], image.shape[0]
+    elif (image.shape[1] > image.shape[0]) != (width > height) and width != height:
+        # OpenCV applied the EXIF rotation, the header size is pre-rotation
+        width, height = height, width
+    return image, (width, height)
+
 # Path to your trained model
 MODEL_PATH = '../../runs/detect/train5/weights/best.pt'
 
@@ -27,40 +88,75 @@ CLASSES_PATH = os.path.join(PROJECT_ROOT, "classes.txt")
 with open(CLASSES_PATH, "r") as f:
     CLASS_NAMES = [line.strip() for line in f.readlines() if line.strip()]
 
-# Load model once at startup
-model = YOLO(MODEL_PATH)
+# Shared helpers (roi.py, ...) live in the project root
+sys.path.insert(0, PROJECT_ROOT)
+from event_store import DetectionStore
+from renderer import Renderer
+from inference_worker import get_roi_masker, register_token, require_authkey, run_model
+from gateway import WorkerPool, WorkerUnavailable, WorkerError
+
+# Append-only detection history, queried through /history; override the location with EVENT_STORE_DIR
+EVENT_STORE_DIR = os.environ.get('EVENT_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'events'))
+store = DetectionStore(EVENT_STORE_DIR, CLASS_NAMES)
+
+color_map = {
+    0: (0, 255, 0),   # FireExtinguisher
+    1: (255, 0, 0),   # ToolBox
+    2: (0, 0, 255)    # OxygenTank
+}
+renderer = Renderer(CLASS_NAMES, colors=color_map, font_scale=0.8)
+
+# Gateway mode (GATEWAY_MODE=1): no local model, /detect is forwarded to inference workers
+# (inference_worker.py) listed in INFERENCE_WORKERS=host:port,... or registered via /workers/register
+GATEWAY_MODE = os.environ.get('GATEWAY_MODE', '0') == '1'
+if GATEWAY_MODE:
+    require_authkey()
+    workers = [a.strip() for a in os.environ.get('INFERENCE_WORKERS', '').split(',') if a.strip()]
+    pool = WorkerPool(workers, timeout=float(os.environ.get('WORKER_TIMEOUT', 30)),
+                      retries=int(os.environ.get('WORKER_RETRIES', 2))).start()
+    model = None
+else:
+    # Load model once at startup
+    model = YOLO(MODEL_PATH)
 
 @app.post('/detect')
-async def detect(file: UploadFile = File(...)):
-    contents = await file.read()
-    nparr = np.frombuffer(contents, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+async def detect(file: UploadFile = File(...), camera: Optional[str] = None):
+    contents = await read_upload(file)
+    masker = get_roi_masker(camera)
+    # Pixel-coordinate ROIs refer to the full-resolution image, so those cameras decode at full size
+    image, original_size = decode_image(contents, allow_reduced=masker is None or masker.normalized)
+    del contents
+    if image is None:
+        raise HTTPException(status_code=400, detail='Could not decode image')
+    # Boxes are computed on the (possibly reduced) decoded image and reported in original pixels
+    scale = np.array([original_size[0] / image.shape[1], original_size[1] / image.shape[0]] * 2, dtype=np.float32)
     all_detections = []
-    color_map = {
-        0: (0, 255, 0),   # FireExtinguisher
-        1: (255, 0, 0),   # ToolBox
-        2: (0, 0, 255)    # OxygenTank
-    }
-    results = model(image)
-    for r in results:
-        if r.boxes is not None:
-            boxes = r.boxes.xyxy.cpu().numpy()
-            confs = r.boxes.conf.cpu().numpy()
-            clss = r.boxes.cls.cpu().numpy().astype(int)
-            for box, conf, cls in zip(boxes, confs, clss):
-                if float(conf) > 0.5:
-                    class_name = CLASS_NAMES[cls] if cls < len(CLASS_NAMES) else str(cls)
-                    all_detections.append({
-                        'class': class_name,
-                        'conf': float(conf),
-                        'box': [float(x) for x in box]
-                    })
-                    # Draw box
-                    x1, y1, x2, y2 = map(int, box)
-                    label = f"{class_name} {conf:.2f}"
-                    color = color_map.get(cls, (255, 255, 0))
-                    cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
-                    cv2.putText(image, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+    kept = []
+    if GATEWAY_MODE:
+        # The worker applies the camera's ROIs itself; the request waits in a thread, not the event loop
+        try:
+            boxes, confs, clss = await run_in_threadpool(pool.infer, image, camera)
+        except WorkerUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except WorkerError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+    else:
+        boxes, confs, clss = run_model(model, image, masker)
+    for box, conf, cls in zip(boxes, confs, clss):
+        if float(conf) > 0.5:
+            kept.append((cls, conf, box))
+            class_name = CLASS_NAMES[cls] if cls < len(CLASS_NAMES) else str(cls)
+            all_detections.append({
+                'class': class_name,
+                'conf': float(conf),
+                'box': [float(x) for x in box * scale]
+            })
+    if kept:
+        renderer.draw(image, [k[2] for k in kept], [k[1] for k in kept], [k[0] for k in kept])
+    if masker:
+        masker.draw(image)
+    image_id = store.append(camera or file.filename or 'upload',
+                            [k[0] for k in kept], [k[1] for k in kept], [k[2] * scale for k in kept])
     # Encode processed image to base64
     _, buffer = cv2.imencode('.png', image)
     img_str = base64.b64encode(buffer).decode('utf-8')
@@ -71,5 +167,44 @@ async def detect(file: UploadFile = File(...)):
         'detections': all_detections,
         'image': img_str,
         'class_counts': class_counts,
-        'confidences': confs
-    }) 
\ No newline at end of file
+        'confidences': confs,
+        'image_id': image_id,
+        'original_size': list(original_size),
+        'image_size': [image.shape[1], image.shape[0]]
+    })
+
+@app.get('/history')
+async def history(
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    cls: Optional[List[str]] = Query(None),
+    source: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    bucket: Optional[float] = Query(None, gt=0)
+):
+    """Page through stored detections (newest first) with per-class and optional per-time-bucket aggregates"""
+    return JSONResponse(store.query(start=start, end=end, classes=cls, source=source,
+                                    offset=offset, limit=limit, bucket=bucket))
+
+def require_gateway():
+    if not GATEWAY_MODE:
+        raise HTTPException(status_code=404, detail='Gateway mode is off (set GATEWAY_MODE=1)')
+
+@app.post('/workers/register')
+async def register_worker(address: str, x_worker_token: str = Header('')):
+    """Called periodically by inference workers started with --gateway (token from RPC_AUTHKEY)"""
+    require_gateway()
+    if not hmac.compare_digest(x_worker_token.encode(), register_token(address).encode()):
+        raise HTTPException(status_code=403, detail='Invalid worker token')
+    try:
+        pool.register(address)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='address must be host:port')
+    return JSONResponse({'registered': address})
+
+@app.get('/workers')
+async def list_workers():
+    """Per-worker health, load, request/failure counts and latency"""
+    require_gateway()
+    return JSONResponse(pool.metrics())
@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+from event_store import DetectionStore
+
+CLASS_NAMES = ['FireExtinguisher', 'ToolBox', 'OxygenTank']
+
+
+def fill(store, images=10, per_image=3):
+    """Image i: `per_image` detections of class i % 3 from cam<i % 2>, at ts 1000 + i"""
+    for i in range(images):
+        clss = [i % 3] * per_image
+        confs = [0.5 + 0.01 * i] * per_image
+        boxes = [[i, i, i + 10, i + 10]] * per_image
+        assert store.append(f'cam{i % 2}', clss, confs, boxes, ts=1000 + i) == i
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DetectionStore(str(tmp_path), CLASS_NAMES, segment_rows=8)
+
+
+def test_append_and_query(store):
+    fill(store)
+    result = store.query(limit=1000)
+    assert result['total'] == 30
+    ts = [d['ts'] for d in result['detections']]
+    assert ts == sorted(ts, reverse=True)
+    assert result['detections'][0]['image'] == 9
+    assert result['aggregates']['class_counts'] == {'FireExtinguisher': 12, 'ToolBox': 9, 'OxygenTank': 9}
+
+
+def test_segments_are_sealed(store):
+    fill(store)
+    sealed = [s for s in store.segments if s.sealed]
+    assert len(sealed) == 3 and not store.segments[-1].sealed
+    assert all(os.path.exists(os.path.join(s.path, 'cls_index.npy')) for s in sealed)
+    assert sum(s.meta['rows'] for s in sealed) + len(store.segments[-1]) == 30
+
+
+def test_filters(store):
+    fill(store)
+    result = store.query(classes=['ToolBox'], limit=1000)
+    assert result['total'] == 9
+    assert {d['image'] for d in result['detections']} == {1, 4, 7}
+
+    result = store.query(source='cam1', limit=1000)
+    assert {d['image'] for d in result['detections']} == {1, 3, 5, 7, 9}
+
+    result = store.query(start=1002, end=1005, classes=['FireExtinguisher', 'OxygenTank'], limit=1000)
+    assert {d['image'] for d in result['detections']} == {2, 3, 5}
+
+    assert store.query(source='unknown')['total'] == 0
+
+
+def test_pagination_across_segments(store):
+    fill(store)
+    everything = store.query(limit=1000)['detections']
+    pages = [store.query(offset=offset, limit=7)['detections'] for offset in range(0, 30, 7)]
+    assert [d for page in pages for d in page] == everything
+    assert store.query(offset=30, limit=7)['detections'] == []
+
+
+def test_image_ids_survive_restart(tmp_path):
+    store = DetectionStore(str(tmp_path), CLASS_NAMES)
+    assert store.append('cam0', [0], [0.9], [[0, 0, 1, 1]], ts=1) == 0
+    # Images without detections store no rows but still use up their number
+    assert store.append('cam0', [], [], np.zeros((0, 4)), ts=2) == 1
+    assert store.append('cam0', [], [], np.zeros((0, 4)), ts=3) == 2
+
+    store = DetectionStore(str(tmp_path), CLASS_NAMES)
+    assert store.append('cam0', [1], [0.8], [[0, 0, 1, 1]], ts=4) == 3
+
+
+def test_reopen_after_truncated_write(tmp_path):
+    store = DetectionStore(str(tmp_path), CLASS_NAMES, segment_rows=100)
+    fill(store, images=4, per_image=2)
+
+    # Crash in the middle of an append: some columns written, `ts` with half a row
+    active = store.segments[-1].path
+    for name, size in (('cls', 2 * 2), ('conf', 2 * 4), ('box', 16 * 2), ('ts', 3)):
+        with open(os.path.join(active, f'{name}.bin'), 'ab') as f:
+            f.write(b'\x01' * size)
+
+    store = DetectionStore(str(tmp_path), CLASS_NAMES, segment_rows=100)
+    assert len(store.segments[-1]) == 8
+    assert store.append('cam1', [2], [0.99], [[5, 6, 7, 8]], ts=2000) == 4
+
+    result = store.query(limit=1000)
+    assert result['total'] == 9
+    newest = result['detections'][0]
+    assert newest == {'ts': 2000.0, 'image': 4, 'source': 'cam1', 'class': 'OxygenTank',
+                      'conf': pytest.approx(0.99), 'box': [5.0, 6.0, 7.0, 8.0]}
+    assert [d['image'] for d in result['detections'][1:]] == [3, 3, 2, 2, 1, 1, 0, 0]
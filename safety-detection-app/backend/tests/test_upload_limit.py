@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')  # TestClient
+pytest.importorskip('multipart')  # python-multipart, for File(...)
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from upload_limit import LimitUploadSize
+
+MAX_BYTES = 1024 * 1024
+BOUNDARY = 'test-boundary'
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(LimitUploadSize, max_bytes=MAX_BYTES, overhead=4096)
+
+    @app.post('/detect')
+    async def detect(file: UploadFile = File(...)):
+        return {'size': len(await file.read())}
+
+    return TestClient(app)
+
+
+def multipart_chunks(size, chunk=64 * 1024):
+    """A multipart body holding `size` bytes of file data, yielded in chunks"""
+    yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+           f'Content-Type: image/jpeg\r\n\r\n').encode()
+    for start in range(0, size, chunk):
+        yield b'\xff' * min(chunk, size - start)
+    yield f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+def post(client, size, chunked):
+    body = multipart_chunks(size)
+    if not chunked:
+        body = b''.join(body)
+    # A generator body is sent with Transfer-Encoding: chunked and no Content-Length
+    return client.post('/detect', content=body,
+                       headers={'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'})
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_upload_under_limit(client, chunked):
+    response = post(client, MAX_BYTES // 2, chunked)
+    assert response.status_code == 200
+    assert response.json() == {'size': MAX_BYTES // 2}
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_upload_over_limit(client, chunked):
+    response = post(client, 3 * MAX_BYTES, chunked)
+    assert response.status_code == 413
+    assert response.json() == {'detail': 'Upload larger than 1 MB'}
+
+
+def test_other_paths_are_not_limited(client):
+    response = client.post('/other', content=b'x' * (2 * MAX_BYTES))
+    assert response.status_code == 404
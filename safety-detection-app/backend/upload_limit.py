@@ -0,0 +1,76 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+
+class UploadTooLarge(HTTPException):
+    """
+    Raised from the receive stream once a body passes the cap
+
+    It is an HTTPException so that FastAPI's body parsing re-raises it as it is; any other
+    exception raised while the form is read is turned into a 400 "error parsing the body".
+    """
+
+    def __init__(self, max_bytes):
+        super().__init__(status_code=413, detail=too_large_detail(max_bytes))
+
+
+def too_large_detail(max_bytes):
+    return f'Upload larger than {max_bytes // (1024 * 1024)} MB'
+
+
+class LimitUploadSize:
+    """
+    ASGI middleware capping the request body of `path` while it is received
+
+    Starlette spools the whole multipart body before the endpoint runs, so the limit has to be
+    applied here: a too large Content-Length is rejected up front, and bytes are counted as
+    they arrive, so chunked requests without a Content-Length are cut off at the cap too.
+    """
+
+    def __init__(self, app, max_bytes, overhead=0, path='/detect'):
+        """
+        Args:
+            app: The wrapped ASGI app
+            max_bytes (int): Largest accepted upload
+            overhead (int): Extra body bytes allowed for the multipart framing around the file
+            path (str): Request path the limit applies to
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+        self.cap = max_bytes + overhead
+        self.path = path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.app(scope, receive, send)
+        length = dict(scope['headers']).get(b'content-length')
+        if length and length.isdigit() and int(length) > self.cap:
+            return await self.reject(scope, receive, send)
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.cap:
+                    raise UploadTooLarge(self.max_bytes)
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            started = started or message['type'] == 'http.response.start'
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadTooLarge:
+            # Normally FastAPI answers the HTTPException itself; this covers reads outside a route
+            if not started:
+                await self.reject(scope, receive, send)
+
+    async def reject(self, scope, receive, send):
+        response = JSONResponse({'detail': too_large_detail(self.max_bytes)}, status_code=413)
+        await response(scope, receive, send)
@@ -0,0 +1,351 @@
+import contextlib
+import cProfile
+import gc
+import json
+import os
+import shutil
+import signal
+import subprocess
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Seconds between report rows
+SAMPLE_INTERVAL = 60.0
+
+# Allocation sites listed per row (0 disables tracemalloc, which slows allocations down)
+TOP_ALLOCATIONS = 10
+
+PERCENTILES = (50, 95, 99)
+
+# Allocation sites left out of the report (the profiler's own and import machinery)
+IGNORED_FRAMES = (tracemalloc.__file__, '<frozen importlib', '<unknown>')
+
+# Length of a py-spy recording started at runtime
+PYSPY_SECONDS = 30
+
+
+def null_stage(name):
+    """Stand-in for SoakMonitor.stage when no monitor is active"""
+    return contextlib.nullcontext()
+
+
+def rss_mb():
+    """Resident set size of this process in MB (psutil, else /proc; NaN if neither is available)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+def default_report_path():
+    return str(Path('soak') / f"soak_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+
+
+class LoopingVideo:
+    """
+    cv2.VideoCapture-like source that replays a video file forever at a fixed rate.
+
+    The file is reopened at the end instead of seeking back, which some codecs do unreliably.
+    Pacing is separate from reading: call wait() once per frame, outside any timed stage, so
+    the sleep never shows up as latency. A frame whose slot has already passed more than one
+    period ago is counted as late and the schedule restarts from now instead of bursting.
+    """
+
+    def __init__(self, path, fps=None):
+        self.path = str(path)
+        self.cap = cv2.VideoCapture(self.path)
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.period = 1.0 / self.fps
+        self.next_time = None
+        self.loops = 0
+        self.late = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.fps if prop == cv2.CAP_PROP_FPS else self.cap.get(prop)
+
+    def wait(self):
+        now = time.perf_counter()
+        if self.next_time is None:
+            self.next_time = now
+            return
+        self.next_time += self.period
+        delay = self.next_time - now
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > self.period:
+            self.late += 1
+            self.next_time = now
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.cap.release()
+            self.cap = cv2.VideoCapture(self.path)
+            self.loops += 1
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class SoakMonitor:
+    """
+    Time-series profiler for long-running detection loops.
+
+    The loop wraps its stages in `stage(name)` and calls `tick()` once per frame. Every
+    `interval` seconds a row is appended to the JSON-lines report with RSS, traced Python
+    memory, the top allocation sites grown since the first row (tracemalloc), per-stage
+    latency percentiles and GC pause statistics for that interval. close() writes a summary
+    (RSS growth rate, first vs last latency percentiles) next to the report.
+
+    Profilers can be toggled while running: toggle_profile() starts/stops cProfile and dumps a
+    .prof file, start_pyspy() records a py-spy flame graph of this process. On POSIX they are
+    also bound to SIGUSR1 and SIGUSR2, for headless runs.
+    """
+
+    def __init__(self, report_path=None, interval=SAMPLE_INTERVAL, duration=None, top=TOP_ALLOCATIONS):
+        """
+        Args:
+            report_path (str): JSON-lines report (default: soak/soak_<timestamp>.jsonl)
+            interval (float): Seconds between report rows
+            duration (float): Stop after this many seconds (None or 0: run until stopped)
+            top (int): Allocation sites per row; 0 disables tracemalloc
+        """
+        self.report_path = Path(report_path or default_report_path())
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        self.report = open(self.report_path, 'w')
+        self.interval = interval
+        self.duration = duration or None
+        self.top = top
+
+        self.latencies = defaultdict(list)
+        self.gc_pauses = defaultdict(list)
+        self._gc_start = None
+        gc.callbacks.append(self._gc_callback)
+        if top:
+            tracemalloc.start()
+        self.baseline = None
+
+        self.profiler = None
+        self.pyspy = None
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda *_: self.toggle_profile())
+            signal.signal(signal.SIGUSR2, lambda *_: self.start_pyspy())
+
+        self.rows = []
+        self.frames = 0
+        self.interval_frames = 0
+        self.start = time.time()
+        self.last_sample = self.start
+        print(f"Soak monitor: report {self.report_path}, row every {interval:g}s, "
+              f"{'until stopped' if not self.duration else f'for {self.duration:.0f}s'}, pid {os.getpid()}")
+        print(f"  Profilers: 'p' toggles cProfile, 'y' records py-spy for {PYSPY_SECONDS}s"
+              + (f" (or kill -USR1/-USR2 {os.getpid()})" if hasattr(signal, 'SIGUSR1') else ''))
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.latencies[name].append((time.perf_counter() - start) * 1000)
+
+    def record(self, name, ms):
+        self.latencies[name].append(ms)
+
+    def _gc_callback(self, phase, info):
+        if phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            self.gc_pauses[info['generation']].append((time.perf_counter() - self._gc_start) * 1000)
+            self._gc_start = None
+
+    def tick(self):
+        """Count a frame and write a row when due; returns False once the duration is over"""
+        self.frames += 1
+        self.interval_frames += 1
+        now = time.time()
+        if now - self.last_sample >= self.interval:
+            self.sample(now)
+        return not (self.duration and now - self.start >= self.duration)
+
+    def _allocations(self):
+        snapshot = tracemalloc.take_snapshot()
+        if self.baseline is None:
+            # Growth is measured from the first row, after model loading and warm-up
+            self.baseline = snapshot
+        stats = snapshot.compare_to(self.baseline, 'lineno')
+        # Filtering the grouped statistics is much cheaper than Snapshot.filter_traces on every trace
+        stats = [s for s in stats if not s.traceback[0].filename.startswith(IGNORED_FRAMES)]
+        stats.sort(key=lambda s: (s.size_diff, s.size), reverse=True)
+        return [{'where': f'{s.traceback[0].filename}:{s.traceback[0].lineno}', 'size_kb': s.size / 1024,
+                 'count': s.count, 'diff_kb': s.size_diff / 1024, 'count_diff': s.count_diff}
+                for s in stats[:self.top]]
+
+    def sample(self, now=None):
+        now = now or time.time()
+        sample_start = time.perf_counter()
+        stages = {}
+        for name, values in self.latencies.items():
+            if not values:
+                continue
+            values = np.array(values)
+            stages[name] = {'n': len(values), 'mean': float(values.mean()), 'max': float(values.max()),
+                            **{f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}}
+        pauses = [p for values in self.gc_pauses.values() for p in values]
+        row = {
+            't': now - self.start,
+            'time': now,
+            'frames': self.frames,
+            'fps': self.interval_frames / max(now - self.last_sample, 1e-9),
+            'rss_mb': rss_mb(),
+            'stages': stages,
+            'gc': {
+                'collections': {str(g): len(v) for g, v in sorted(self.gc_pauses.items())},
+                'pause_ms_total': float(sum(pauses)),
+                'pause_ms_max': float(max(pauses, default=0.0)),
+                'objects': len(gc.get_objects()),
+            },
+        }
+        if self.top:
+            current, peak = tracemalloc.get_traced_memory()
+            row['traced_mb'] = current / 2 ** 20
+            row['traced_peak_mb'] = peak / 2 ** 20
+            row['top_allocations'] = self._allocations()
+        # Sampling itself (snapshot, gc.get_objects) stalls the loop; recorded so spikes can be attributed
+        row['sample_ms'] = (time.perf_counter() - sample_start) * 1000
+
+        self.report.write(json.dumps(row) + '\n')
+        self.report.flush()
+        self.rows.append({'t': row['t'], 'rss_mb': row['rss_mb'], 'stages': stages})
+        frame_p95 = stages.get('frame', {}).get('p95', float('nan'))
+        print(f"[soak {row['t'] / 3600:6.2f}h] frames {self.frames} | {row['fps']:.1f} FPS | RSS {row['rss_mb']:.1f} MB"
+              f" | frame p95 {frame_p95:.1f} ms | GC {row['gc']['pause_ms_total']:.1f} ms")
+
+        self.latencies.clear()
+        self.gc_pauses.clear()
+        self.interval_frames = 0
+        self.last_sample = now
+
+    def toggle_profile(self):
+        """Start cProfile, or stop it and dump the stats next to the report"""
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            print("cProfile started")
+            return
+        self.profiler.disable()
+        path = self.report_path.with_name(f"{self.report_path.stem}_{time.strftime('%H%M%S')}.prof")
+        self.profiler.dump_stats(str(path))
+        self.profiler = None
+        print(f"cProfile stopped, stats saved to {path} (view with python -m pstats or snakeviz)")
+
+    def start_pyspy(self, seconds=PYSPY_SECONDS):
+        """Record a py-spy flame graph of this process in the background"""
+        if self.pyspy is not None and self.pyspy.poll() is None:
+            print("py-spy is already recording")
+            return
+        pyspy = shutil.which('py-spy')
+        if pyspy is None:
+            print(f"py-spy not found (pip install py-spy), or attach manually: py-spy record --pid {os.getpid()}")
+            return
+        path = self.report_path.with_name(f"{self.report_path.stem}_{time.strftime('%H%M%S')}.svg")
+        self.pyspy = subprocess.Popen([pyspy, 'record', '--pid', str(os.getpid()), '--duration', str(seconds),
+                                       '--output', str(path), '--nonblocking'])
+        print(f"py-spy recording {seconds}s to {path}")
+
+    def handle_key(self, key):
+        """Profiler hotkeys for OpenCV display loops"""
+        if key == ord('p'):
+            self.toggle_profile()
+        elif key == ord('y'):
+            self.start_pyspy()
+
+    def summary(self):
+        """RSS growth rate and first vs last interval latency percentiles over the whole run"""
+        rows = self.rows[1:] if len(self.rows) > 2 else self.rows
+        summary = {'duration_s': time.time() - self.start, 'frames': self.frames, 'rows': len(self.rows)}
+        if rows:
+            t = np.array([r['t'] for r in rows]) / 3600
+            rss = np.array([r['rss_mb'] for r in rows])
+            summary['rss_mb_first'] = float(rss[0])
+            summary['rss_mb_last'] = float(rss[-1])
+            # Slope after the first (warm-up) row: steady growth here is the leak signal
+            summary['rss_mb_per_hour'] = float(np.polyfit(t, rss, 1)[0]) if len(rows) > 1 and np.isfinite(rss).all() else None
+            summary['stages'] = {
+                name: {**{f'p{p}_first': rows[0]['stages'][name][f'p{p}'] for p in PERCENTILES},
+                       **{f'p{p}_last': rows[-1]['stages'][name][f'p{p}'] for p in PERCENTILES}}
+                for name in rows[0]['stages'] if name in rows[-1]['stages']
+            }
+        return summary
+
+    def close(self):
+        if self.interval_frames:
+            self.sample()
+        if self.profiler is not None:
+            self.toggle_profile()
+        gc.callbacks.remove(self._gc_callback)
+        if self.top:
+            tracemalloc.stop()
+        self.report.close()
+
+        summary = self.summary()
+        path = self.report_path.with_name(f'{self.report_path.stem}_summary.json')
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        growth = summary.get('rss_mb_per_hour')
+        print(f"Soak summary: {summary['frames']} frames in {summary['duration_s'] / 3600:.2f}h, "
+              f"RSS growth {'n/a' if growth is None else f'{growth:+.1f} MB/h'}; saved to {path}")
+        for name, s in summary.get('stages', {}).items():
+            print(f"  {name:>10}: p95 {s['p95_first']:.1f} -> {s['p95_last']:.1f} ms, p99 {s['p99_first']:.1f} -> {s['p99_last']:.1f} ms")
+        plot_report(self.report_path)
+        return summary
+
+
+def plot_report(report_path):
+    """RSS and per-stage p95 latency over time from a soak report"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib not installed, skipping soak plots")
+        return
+    with open(report_path, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    if not rows:
+        return
+    t = np.array([r['t'] for r in rows]) / 3600
+    fig, (ax_mem, ax_lat) = plt.subplots(2, 1, figsize=(10, 7), sharex=True)
+    ax_mem.plot(t, [r['rss_mb'] for r in rows], label='RSS')
+    if 'traced_mb' in rows[0]:
+        ax_mem.plot(t, [r['traced_mb'] for r in rows], label='tracemalloc')
+    ax_mem.set_ylabel('MB')
+    ax_mem.legend(loc='upper left')
+    for name in rows[-1]['stages']:
+        ax_lat.plot(t, [r['stages'].get(name, {}).get('p95', np.nan) for r in rows], label=f'{name} p95')
+    ax_lat.set_ylabel('ms')
+    ax_lat.set_xlabel('hours')
+    ax_lat.legend(loc='upper left')
+    fig.tight_layout()
+    path = Path(report_path).with_suffix('.png')
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+    print(f"Soak plot saved to {path}")
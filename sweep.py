@@ -0,0 +1,177 @@
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from evaluate import IMAGE_SUFFIXES, ap_per_class, match_predictions, nms, read_labels, split_dirs, xywh2xyxy
+
+this_dir = Path(__file__).parent
+MODEL_PATH = this_dir / "runs" / "detect" / "train5" / "weights" / "best.pt"
+
+# Candidates are collected once with these permissive settings; every sweep point is a subset
+RAW_CONF = 0.001
+RAW_IOU = 0.9
+RAW_MAX_DET = 1000
+
+
+def collect(model_path, data_config, split, output, imgsz=640, device=None):
+    """
+    Run the model once over a split at a very low confidence and store every candidate
+
+    The store is one compressed .npz: normalized xywh boxes (float32), confidences (float16)
+    and class ids (uint8) for all images, concatenated, plus per-image offsets and stems.
+    NMS is applied at RAW_IOU so near-duplicates are already gone, but any stricter IoU
+    threshold can still be re-applied offline.
+    """
+    from ultralytics import YOLO
+
+    images_dir, _, names = split_dirs(data_config, split)
+    images = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    model = YOLO(str(model_path))
+
+    boxes, confs, clss, counts = [], [], [], []
+    for result in model.predict([str(p) for p in images], stream=True, conf=RAW_CONF, iou=RAW_IOU,
+                                max_det=RAW_MAX_DET, imgsz=imgsz, device=device, verbose=False):
+        boxes.append(result.boxes.xywhn.cpu().numpy().astype(np.float32))
+        confs.append(result.boxes.conf.cpu().numpy().astype(np.float16))
+        clss.append(result.boxes.cls.cpu().numpy().astype(np.uint8))
+        counts.append(len(result.boxes))
+
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        output,
+        boxes=np.concatenate(boxes) if boxes else np.zeros((0, 4), np.float32),
+        conf=np.concatenate(confs) if confs else np.zeros(0, np.float16),
+        cls=np.concatenate(clss) if clss else np.zeros(0, np.uint8),
+        offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        stems=np.array([p.stem for p in images]),
+        names=np.array(names),
+        split=np.array(split),
+    )
+    print(f"Stored {sum(counts)} candidates for {len(images)} images in {output}")
+
+
+def sweep_image(args):
+    """NMS one image's candidates at every IoU threshold and match them to the ground truth"""
+    pred, gt, iou_thresholds = args
+    out = []
+    boxes = xywh2xyxy(pred[:, 1:5])
+    for t in iou_thresholds:
+        kept = pred[nms(boxes, pred[:, 5], pred[:, 0], t)] if t < RAW_IOU else pred
+        out.append((match_predictions(kept, gt), kept[:, 5], kept[:, 0].astype(int)))
+    return out, gt[:, 0].astype(int)
+
+
+def sweep(raw_path, data_config, iou_thresholds, output_dir, workers=None):
+    """
+    Re-apply NMS at each IoU threshold and evaluate every confidence threshold at once
+
+    Confidence is applied after NMS here; greedy NMS keeps boxes in confidence order, so this
+    gives the same boxes as filtering by confidence first. Re-applying NMS on the stored set
+    (already NMS'd at RAW_IOU) matches a fresh NMS run except in rare suppression chains.
+    """
+    raw = np.load(raw_path)
+    names = [str(n) for n in raw['names']]
+    split = str(raw['split'])
+    _, labels_dir, _ = split_dirs(data_config, split)
+    offsets = raw['offsets']
+    pred_all = np.concatenate([raw['cls'][:, None].astype(np.float64), raw['boxes'].astype(np.float64),
+                               raw['conf'][:, None].astype(np.float64)], axis=1)
+
+    jobs = [(pred_all[offsets[i]:offsets[i + 1]], read_labels(str(Path(labels_dir) / f'{stem}.txt'), with_conf=False),
+             iou_thresholds) for i, stem in enumerate(raw['stems'])]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(sweep_image, jobs, chunksize=max(1, len(jobs) // 64)))
+    gt_cls = np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=int)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rows = []
+    curves = {}
+    for k, t in enumerate(iou_thresholds):
+        tp = np.concatenate([r[0][k][0] for r in results])
+        conf = np.concatenate([r[0][k][1] for r in results])
+        pred_cls = np.concatenate([r[0][k][2] for r in results])
+        metrics = ap_per_class(tp, conf, pred_cls, gt_cls, len(names))
+        curves[t] = metrics
+        px = metrics['px']
+        f1 = 2 * metrics['p_curve'] * metrics['r_curve'] / (metrics['p_curve'] + metrics['r_curve'] + 1e-16)
+        for c, name in enumerate(names):
+            # F1 is often flat over a confidence range; take the highest confidence of the plateau
+            best = int(np.flatnonzero(np.isclose(f1[c], f1[c].max(), rtol=0, atol=1e-6))[-1])
+            rows.append({'class': name, 'nms_iou': t, 'conf': round(float(px[best]), 3),
+                         'precision': round(float(metrics['p_curve'][c, best]), 4),
+                         'recall': round(float(metrics['r_curve'][c, best]), 4),
+                         'f1': round(float(f1[c, best]), 4),
+                         'mAP50': round(float(metrics['ap'][c, 0]), 4),
+                         'mAP50-95': round(float(metrics['ap'][c].mean()), 4)})
+
+    with open(output_dir / 'sweep.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"{'Class':>20}{'NMS IoU':>9}{'conf':>8}{'P':>8}{'R':>8}{'F1':>8}{'mAP50':>8}{'mAP50-95':>10}   (best F1 per class)")
+    for name in names:
+        best = max((r for r in rows if r['class'] == name), key=lambda r: r['f1'])
+        print(f"{name:>20}{best['nms_iou']:>9.2f}{best['conf']:>8.3f}{best['precision']:>8.3f}{best['recall']:>8.3f}"
+              f"{best['f1']:>8.3f}{best['mAP50']:>8.3f}{best['mAP50-95']:>10.3f}")
+
+    plot_curves(curves, names, output_dir)
+    print(f"Sweep results saved in {output_dir}")
+    return rows
+
+
+def plot_curves(curves, names, output_dir):
+    """One precision-recall plot per class with a curve per NMS IoU threshold"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib not installed, skipping PR curve plots")
+        return
+    fig, axes = plt.subplots(1, len(names), figsize=(5 * len(names), 4.5), squeeze=False)
+    for c, name in enumerate(names):
+        ax = axes[0, c]
+        for t, metrics in curves.items():
+            ax.plot(metrics['r_curve'][c], metrics['p_curve'][c], label=f"NMS IoU {t:.2f}")
+        ax.set_title(name)
+        ax.set_xlabel('Recall')
+        ax.set_ylabel('Precision')
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1.01)
+        ax.legend(loc='lower left')
+    fig.tight_layout()
+    fig.savefig(output_dir / 'PR_sweep.png', dpi=150)
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Infer once at low confidence, then sweep conf/IoU thresholds offline")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('collect', help='Run the model once and store low-threshold candidates')
+    p.add_argument('--model', type=str, default=str(MODEL_PATH), help='Model weights')
+    p.add_argument('--data', type=str, default=str(this_dir / 'yolo_params.yaml'), help='Dataset config')
+    p.add_argument('--split', type=str, default='test', help='Split to run on (default: test)')
+    p.add_argument('--imgsz', type=int, default=640, help='Inference size (default: 640)')
+    p.add_argument('--device', type=str, default=None, help='Device, e.g. 0 or cpu (default: auto)')
+    p.add_argument('--output', type=str, default=None, help='Output .npz (default: predictions/raw_<split>.npz)')
+
+    p = sub.add_parser('sweep', help='Re-apply NMS and thresholds to stored candidates')
+    p.add_argument('--raw', type=str, default=str(this_dir / 'predictions' / 'raw_test.npz'), help='Stored candidates')
+    p.add_argument('--data', type=str, default=str(this_dir / 'yolo_params.yaml'), help='Dataset config')
+    p.add_argument('--iou', type=float, nargs='+', default=[0.3, 0.45, 0.5, 0.6, 0.7],
+                   help=f'NMS IoU thresholds to try (at most {RAW_IOU})')
+    p.add_argument('--output', type=str, default=str(this_dir / 'predictions' / 'sweep'), help='Output directory')
+    p.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+
+    args = parser.parse_args()
+    if args.command == 'collect':
+        output = args.output or str(this_dir / 'predictions' / f'raw_{args.split}.npz')
+        collect(args.model, args.data, args.split, output, args.imgsz, args.device)
+    else:
+        sweep(args.raw, args.data, args.iou, args.output, args.workers)
@@ -1,11 +1,30 @@
 import os
+import torch
 from ultralytics import YOLO
 from pathlib import Path
 
+from image_cache import CachedDetectionTrainer
+
 # Set up paths
 base_dir = Path(__file__).parent
 DATA_CONFIG = os.path.join(base_dir, "yolo_params.yaml")
 
+
+def select_device():
+    """First CUDA GPU if there is one, then Apple MPS, otherwise CPU"""
+    if torch.cuda.is_available():
+        return 0
+    if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+# Loader workers run decoding and augmentation (mosaic, mixup, HSV) next to the training step
+WORKERS = min(8, os.cpu_count() or 1)
+
+# Read decoded, resized images from the memory-mapped store in data/cache (see image_cache.py)
+USE_IMAGE_CACHE = True
+
 # Standard training arguments for train/val split
 TRAIN_ARGS = dict(
     model="yolov8l.pt",  # Change to yolov8l.pt if your GPU can handle it
@@ -26,12 +45,12 @@ TRAIN_ARGS = dict(
     mosaic=1.0,
     mixup=0.3,
     patience=0,
-    workers=0,
-    device=0,
+    workers=WORKERS,
+    device=select_device(),
     single_cls=False
 )
 
 if __name__ == '__main__':
  
     model = YOLO(TRAIN_ARGS['model'])
-    results = model.train(**TRAIN_ARGS)
\ No newline at end of file
+    results = model.train(trainer=CachedDetectionTrainer if USE_IMAGE_CACHE else None, **TRAIN_ARGS)
\ No newline at end of file
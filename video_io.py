@@ -0,0 +1,201 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+
+# Queue depth between the inference loop and the ffmpeg pipes
+QUEUE_SIZE = 32
+
+# Codecs that understand x264-style -preset values
+PRESET_CODECS = ('libx264', 'libx265', 'h264_nvenc', 'hevc_nvenc')
+
+
+def find_ffmpeg():
+    """
+    Locate an ffmpeg binary: $FFMPEG_BINARY, then PATH, then the one bundled with imageio-ffmpeg
+
+    Returns:
+        str: Path to ffmpeg, or None if none is available
+    """
+    path = os.environ.get('FFMPEG_BINARY') or shutil.which('ffmpeg')
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+class FFmpegReader:
+    """
+    cv2.VideoCapture-like reader that decodes through an ffmpeg subprocess.
+
+    ffmpeg decodes in its own process and writes raw BGR frames to a pipe; a background thread
+    slices the pipe into frames and keeps up to `queue_size` of them ready, so decoding overlaps
+    with inference instead of running on the inference thread.
+    """
+
+    def __init__(self, source, queue_size=QUEUE_SIZE, ffmpeg=None):
+        # Probe size and frame rate with OpenCV; ffmpeg then only has to stream pixels
+        probe = cv2.VideoCapture(source)
+        self.width = int(probe.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(probe.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = probe.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(probe.get(cv2.CAP_PROP_FRAME_COUNT))
+        opened = probe.isOpened() and self.width > 0 and self.height > 0
+        probe.release()
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.process = None
+        self.thread = None
+        if not opened:
+            return
+        cmd = [ffmpeg or find_ffmpeg(), '-loglevel', 'error', '-nostdin', '-i', str(source),
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=10 ** 7)
+        self.thread = threading.Thread(target=self._decode, daemon=True)
+        self.thread.start()
+
+    def _decode(self):
+        frame_size = self.width * self.height * 3
+        try:
+            while True:
+                # Read straight into a fresh writable array so callers can draw on it in place
+                frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+                view = memoryview(frame).cast('B')
+                filled = 0
+                while filled < frame_size:
+                    n = self.process.stdout.readinto(view[filled:])
+                    if not n:
+                        return
+                    filled += n
+                self.queue.put(frame)
+        finally:
+            self.queue.put(None)
+
+    def isOpened(self):
+        return self.process is not None
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_WIDTH: self.width, cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                cv2.CAP_PROP_FPS: self.fps, cv2.CAP_PROP_FRAME_COUNT: self.frame_count}.get(prop, 0)
+
+    def read(self):
+        """Return (ret, frame) like cv2.VideoCapture.read"""
+        if self.process is None:
+            return False, None
+        frame = self.queue.get()
+        if frame is None:
+            self.queue.put(None)  # keep reporting end of stream
+            return False, None
+        return True, frame
+
+    def release(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        # Unblock the decode thread if it is waiting on a full queue
+        while self.thread.is_alive():
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.thread.join(timeout=0.05)
+        self.process = None
+
+
+class FFmpegWriter:
+    """
+    cv2.VideoWriter-like writer that encodes through an ffmpeg subprocess.
+
+    write() only enqueues the frame; a background thread feeds the bounded queue into ffmpeg's
+    stdin, and the encoder runs in its own process. When the queue is full write() blocks, so a
+    slow encoder slows the loop down instead of growing memory. Frames must not be modified
+    after they are passed to write().
+    """
+
+    def __init__(self, path, fps, size, codec='libx264', preset='ultrafast', crf=23,
+                 queue_size=QUEUE_SIZE, ffmpeg=None):
+        """
+        Args:
+            path (str): Output file
+            fps (float): Output frame rate
+            size (tuple): (width, height) of the frames that will be written
+            codec (str): ffmpeg video encoder (libx264, libx265, mpeg4, h264_nvenc, ...)
+            preset (str): Encoder preset for x264-style encoders (ultrafast ... veryslow)
+            crf (int): Constant rate factor for x264-style encoders (lower is better quality)
+            queue_size (int): Frames buffered between write() and the encoder
+            ffmpeg (str): ffmpeg binary (default: find_ffmpeg())
+        """
+        width, height = size
+        cmd = [ffmpeg or find_ffmpeg(), '-loglevel', 'error', '-y',
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps}', '-i', '-',
+               '-an', '-c:v', codec]
+        if codec in PRESET_CODECS:
+            cmd += ['-preset', preset, '-crf', str(crf)]
+        # yuv420p (needed by most players) requires even dimensions
+        cmd += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', str(path)]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=10 ** 7)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._encode, daemon=True)
+        self.thread.start()
+
+    def _encode(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.process.stdin.write(np.ascontiguousarray(frame).data)
+            except (BrokenPipeError, OSError) as e:
+                self.error = e
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        self.queue.put(frame)
+
+    def release(self):
+        """Flush queued frames and wait for ffmpeg to finish the file"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.wait()
+        if self.error is not None:
+            print(f"ffmpeg writer error: {self.error}")
+
+
+def open_video_reader(source, backend='opencv'):
+    """Open a capture; the ffmpeg backend is used for files and stream URLs, never for webcam indices"""
+    if backend == 'ffmpeg' and not isinstance(source, int):
+        if find_ffmpeg() is None:
+            print("ffmpeg not found, falling back to OpenCV for reading")
+        else:
+            return FFmpegReader(source)
+    return cv2.VideoCapture(source)
+
+
+def open_video_writer(path, fps, size, backend='opencv', codec='libx264', preset='ultrafast', crf=23):
+    """Open a writer: ffmpeg pipe with the given codec/preset, or the original OpenCV mp4v writer"""
+    if backend == 'ffmpeg':
+        if find_ffmpeg() is None:
+            print("ffmpeg not found, falling back to OpenCV mp4v writer")
+        else:
+            return FFmpegWriter(path, fps, size, codec=codec, preset=preset, crf=crf)
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)